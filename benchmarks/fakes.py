@@ -0,0 +1,484 @@
+"""
+Server finti in-process per il benchmark di PlexGuard: Plex, qBittorrent, TMDB e Telegram Bot API.
+
+Ogni server è un'app Starlette servita da uvicorn in un thread dedicato, con latenza
+iniettabile e un contatore delle chiamate ricevute per tipo di endpoint.
+"""
+import asyncio
+import collections
+import json
+import socket
+import threading
+import time
+import urllib.parse
+from xml.sax.saxutils import quoteattr
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+LANGUAGES = ["English", "Italian", "Japanese", "French"]
+
+
+class FakeServer:
+    """Base dei server finti: latenza iniettata, conteggio chiamate, avvio in un thread."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = collections.Counter()
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.port = None
+
+    def routes(self):
+        raise NotImplementedError
+
+    async def hit(self, name):
+        with self._lock:
+            self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        config = uvicorn.Config(Starlette(routes=self.routes()), host="127.0.0.1", port=self.port,
+                                log_level="warning", lifespan="off")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=5)
+
+
+def _xml(body, **attrs):
+    attributes = "".join(f" {key}={quoteattr(str(value))}" for key, value in attrs.items())
+    return Response(f'<?xml version="1.0" encoding="UTF-8"?><MediaContainer{attributes}>{body}</MediaContainer>',
+                    media_type="text/xml")
+
+
+def _paging(request):
+    start = request.headers.get("X-Plex-Container-Start") or request.query_params.get("X-Plex-Container-Start")
+    size = request.headers.get("X-Plex-Container-Size") or request.query_params.get("X-Plex-Container-Size")
+    return int(start or 0), int(size) if size is not None else None
+
+
+def movie_file(index, version=1):
+    """Percorso del file del film `index` nella libreria finta, alla versione `version`."""
+    return f"/media/movies/Movie {index}/Movie {index} - v{version}.mkv"
+
+
+def episode_file(show, season, episode, version=1):
+    """Percorso del file di un episodio nella libreria finta, alla versione `version`."""
+    return f"/media/tv/Show {show}/Season {season}/Show {show} - s{season:02d}e{episode:02d} - v{version}.mkv"
+
+
+def _file_stem(path):
+    """Percorso senza il suffisso di versione: identifica l'elemento a cui appartiene il file."""
+    return path.rsplit(" - v", 1)[0]
+
+
+class FakePlex(FakeServer):
+    """
+    Libreria Plex sintetica con `movies` film e `shows` serie da `seasons` stagioni
+    di `episodes` episodi. I tmdbId partono da 1 per i film e da 100000 per le serie.
+
+    Simula anche la scansione: i file scritti con `write_file` (come farebbero Radarr e
+    Sonarr) compaiono sull'elemento solo `scan_delay` secondi dopo la richiesta di scansione
+    della loro cartella, con l'italiano tra le tracce audio; a fine scansione viene inviata
+    una notifica "activity ended" sul websocket /:/websockets/notifications.
+    """
+
+    MOVIE_SECTION = "1"
+    SHOW_SECTION = "2"
+    SHOW_TMDB_OFFSET = 100000
+
+    def __init__(self, movies=1000, shows=100, seasons=2, episodes=10, latency=0.0, scan_delay=0.0):
+        super().__init__(latency)
+        self.scan_delay = scan_delay
+        self.items = {}
+        self.section_items = {self.MOVIE_SECTION: [], self.SHOW_SECTION: []}
+        self.children = collections.defaultdict(list)
+        # Elemento per percorso senza versione, file scritti ma non ancora scansionati, client websocket
+        self.by_stem = {}
+        self.unscanned = {}
+        self.websockets = set()
+        self._scans = set()
+        now = int(time.time()) - 86400
+        rating_key = 1
+        for index in range(1, movies + 1):
+            self._add_file(rating_key, movie_file(index))
+            self.items[rating_key].update({"type": "movie", "title": f"Movie {index}", "tmdb": index,
+                                           "updatedAt": now})
+            self.section_items[self.MOVIE_SECTION].append(rating_key)
+            rating_key += 1
+        for index in range(1, shows + 1):
+            show_key = rating_key
+            self.items[show_key] = {"type": "show", "title": f"Show {index}",
+                                    "tmdb": self.SHOW_TMDB_OFFSET + index, "updatedAt": now,
+                                    "childCount": seasons}
+            self.section_items[self.SHOW_SECTION].append(show_key)
+            rating_key += 1
+            for season_number in range(1, seasons + 1):
+                season_key = rating_key
+                self.items[season_key] = {"type": "season", "index": season_number, "parent": show_key,
+                                          "title": f"Stagione {season_number}", "updatedAt": now}
+                self.children[show_key].append(season_key)
+                rating_key += 1
+                for episode_number in range(1, episodes + 1):
+                    self._add_file(rating_key, episode_file(index, season_number, episode_number))
+                    self.items[rating_key].update({"type": "episode", "index": episode_number, "parent": season_key,
+                                                   "show": show_key, "title": f"Episode {episode_number}",
+                                                   "updatedAt": now})
+                    self.children[season_key].append(rating_key)
+                    rating_key += 1
+
+    def _add_file(self, rating_key, path):
+        self.items[rating_key] = {"file": path, "size": 1024 ** 3,
+                                  "languages": LANGUAGES[:1 + rating_key % len(LANGUAGES)]}
+        self.by_stem[_file_stem(path)] = rating_key
+
+    def write_file(self, path, size):
+        """Scrive un file nella libreria: Plex lo vedrà alla prossima scansione della sua cartella."""
+        with self._lock:
+            self.unscanned[path] = size
+
+    async def _scan(self, path):
+        await asyncio.sleep(self.scan_delay)
+        prefix = path.rstrip("/") + "/"
+        with self._lock:
+            found = {file: size for file, size in self.unscanned.items() if file.startswith(prefix)}
+            for file in found:
+                del self.unscanned[file]
+        for file, size in found.items():
+            rating_key = self.by_stem.get(_file_stem(file))
+            if rating_key is None:
+                continue
+            item = self.items[rating_key]
+            item.update({"file": file, "size": size, "updatedAt": int(time.time()),
+                         "languages": list(dict.fromkeys(item["languages"] + ["Italian"]))})
+        await self._broadcast({"type": "activity", "size": 1, "ActivityNotification": [
+            {"event": "ended", "uuid": f"scan-{time.monotonic()}",
+             "Activity": {"type": "library.update.section", "title": f"Scansione di {path}"}}]})
+
+    def _start_scan(self, path):
+        task = asyncio.create_task(self._scan(path))
+        self._scans.add(task)
+        task.add_done_callback(self._scans.discard)
+
+    async def _broadcast(self, container):
+        message = json.dumps({"NotificationContainer": container})
+        for websocket in list(self.websockets):
+            try:
+                await websocket.send_text(message)
+            except Exception:
+                self.websockets.discard(websocket)
+
+    def routes(self):
+        return [
+            Route("/", self.root),
+            Route("/identity", self.identity),
+            Route("/library", self.library),
+            Route("/library/sections", self.sections),
+            Route("/library/sections/{section}/all", self.section_all),
+            Route("/library/sections/{section}/collections", self.section_collections),
+            Route("/library/sections/{section}/refresh", self.section_refresh),
+            Route("/library/metadata/{rating_keys}", self.metadata),
+            Route("/library/metadata/{rating_key:int}/children", self.metadata_children),
+            Route("/library/metadata/{rating_key:int}/allLeaves", self.metadata_all_leaves),
+            Route("/library/metadata/{rating_key:int}/refresh", self.metadata_refresh, methods=["PUT"]),
+            WebSocketRoute("/:/websockets/notifications", self.notifications),
+        ]
+
+    def _element(self, rating_key, full=False):
+        item = self.items[rating_key]
+        if item["type"] == "movie":
+            attrs = {"ratingKey": rating_key, "key": f"/library/metadata/{rating_key}", "type": "movie",
+                     "title": item["title"], "summary": f"Trama di {item['title']}",
+                     "librarySectionID": self.MOVIE_SECTION, "librarySectionTitle": "Film",
+                     "updatedAt": item["updatedAt"], "addedAt": item["updatedAt"]}
+            guids = f'<Guid id="tmdb://{item["tmdb"]}"/><Guid id="imdb://tt{item["tmdb"]:07d}"/>'
+            return self._video(attrs, guids, rating_key, item, full)
+        if item["type"] == "show":
+            attrs = {"ratingKey": rating_key, "key": f"/library/metadata/{rating_key}/children", "type": "show",
+                     "title": item["title"], "summary": f"Trama di {item['title']}",
+                     "librarySectionID": self.SHOW_SECTION, "librarySectionTitle": "Serie TV",
+                     "childCount": item["childCount"], "updatedAt": item["updatedAt"], "addedAt": item["updatedAt"]}
+            guids = f'<Guid id="tmdb://{item["tmdb"]}"/><Guid id="tvdb://{item["tmdb"]}"/>'
+            return f"<Directory{_attrs(attrs)}>{guids}</Directory>"
+        if item["type"] == "season":
+            show = self.items[item["parent"]]
+            attrs = {"ratingKey": rating_key, "key": f"/library/metadata/{rating_key}/children", "type": "season",
+                     "title": item["title"], "index": item["index"], "parentRatingKey": item["parent"],
+                     "parentTitle": show["title"], "librarySectionID": self.SHOW_SECTION}
+            return f"<Directory{_attrs(attrs)}/>"
+        season = self.items[item["parent"]]
+        show = self.items[item["show"]]
+        attrs = {"ratingKey": rating_key, "key": f"/library/metadata/{rating_key}", "type": "episode",
+                 "title": item["title"], "summary": f"Trama di {item['title']}", "index": item["index"],
+                 "parentIndex": season["index"], "parentRatingKey": item["parent"],
+                 "grandparentRatingKey": item["show"], "grandparentTitle": show["title"],
+                 "librarySectionID": self.SHOW_SECTION, "librarySectionTitle": "Serie TV",
+                 "updatedAt": item["updatedAt"], "addedAt": item["updatedAt"]}
+        return self._video(attrs, "", rating_key, item, full)
+
+    @staticmethod
+    def _video(attrs, guids, rating_key, item, full):
+        streams = ""
+        if full:
+            streams = '<Stream id="1" streamType="1" codec="h264"/>' + "".join(
+                f'<Stream id="{2 + i}" streamType="2" language="{language}"/>'
+                for i, language in enumerate(item["languages"]))
+        media = (f'<Media id="{rating_key}" videoResolution="1080">'
+                 f'<Part id="{rating_key}" file={quoteattr(item["file"])} size="{item["size"]}">{streams}</Part>'
+                 '</Media>')
+        return f"<Video{_attrs(attrs)}>{media}{guids}</Video>"
+
+    async def root(self, request: Request):
+        await self.hit("root")
+        return _xml("", friendlyName="FakePlex", machineIdentifier="fakeplex", version="1.40.0.0")
+
+    async def identity(self, request: Request):
+        await self.hit("identity")
+        return _xml("", machineIdentifier="fakeplex", version="1.40.0.0")
+
+    async def library(self, request: Request):
+        await self.hit("library")
+        return _xml("", title1="Plex Library")
+
+    async def sections(self, request: Request):
+        await self.hit("sections")
+        body = (f'<Directory key="{self.MOVIE_SECTION}" type="movie" title="Film" agent="tv.plex.agents.movie">'
+                '<Location id="1" path="/media/movies"/></Directory>'
+                f'<Directory key="{self.SHOW_SECTION}" type="show" title="Serie TV" agent="tv.plex.agents.series">'
+                '<Location id="2" path="/media/tv"/></Directory>')
+        return _xml(body, size=2)
+
+    def _meta(self, section):
+        libtype = "movie" if section == self.MOVIE_SECTION else "show"
+        type_number = 1 if libtype == "movie" else 2
+        return ("<Meta>"
+                f'<Type key="/library/sections/{section}/all?type={type_number}" type="{libtype}" title="{libtype}" '
+                'active="1"><Field key="addedAt" title="Date Added" type="date"/>'
+                '<Field key="updatedAt" title="Date Updated" type="date"/></Type>'
+                '<FieldType type="date"><Operator key="&gt;&gt;=" title="is after"/>'
+                '<Operator key="&lt;&lt;=" title="is before"/></FieldType>'
+                "</Meta>")
+
+    async def section_all(self, request: Request):
+        section = request.path_params["section"]
+        if request.query_params.get("includeMeta"):
+            await self.hit("section_meta")
+            return _xml(self._meta(section), size=0, totalSize=len(self.section_items[section]))
+
+        await self.hit("section_all")
+        keys = self.section_items[section]
+        for field in ("addedAt", "updatedAt"):
+            since = request.query_params.get(f"{field}>>")
+            if since is not None:
+                keys = [key for key in keys if self.items[key]["updatedAt"] > int(since)]
+        start, size = _paging(request)
+        page = keys[start:start + size] if size is not None else keys[start:]
+        body = "".join(self._element(key) for key in page)
+        return _xml(body, size=len(page), totalSize=len(keys), librarySectionID=section)
+
+    async def section_collections(self, request: Request):
+        await self.hit("section_meta")
+        return _xml("", size=0)
+
+    async def section_refresh(self, request: Request):
+        await self.hit("section_refresh")
+        section = request.path_params["section"]
+        self._start_scan(request.query_params.get("path")
+                         or ("/media/movies" if section == self.MOVIE_SECTION else "/media/tv"))
+        return Response(status_code=200)
+
+    async def metadata(self, request: Request):
+        # Come Plex, accetta anche più ratingKey separati da virgola
+        await self.hit("metadata")
+        keys = [int(key) for key in request.path_params["rating_keys"].split(",") if key.isdigit()]
+        keys = [key for key in keys if key in self.items]
+        if not keys:
+            return Response(status_code=404)
+        return _xml("".join(self._element(key, full=True) for key in keys), size=len(keys))
+
+    async def metadata_children(self, request: Request):
+        await self.hit("metadata_children")
+        keys = self.children.get(request.path_params["rating_key"], [])
+        body = "".join(self._element(key) for key in keys)
+        return _xml(body, size=len(keys), totalSize=len(keys))
+
+    async def metadata_all_leaves(self, request: Request):
+        await self.hit("metadata_all_leaves")
+        keys = [episode for season in self.children.get(request.path_params["rating_key"], [])
+                for episode in self.children[season]]
+        body = "".join(self._element(key) for key in keys)
+        return _xml(body, size=len(keys), totalSize=len(keys))
+
+    async def metadata_refresh(self, request: Request):
+        await self.hit("metadata_refresh")
+        item = self.items.get(request.path_params["rating_key"])
+        if item is not None and "file" in item:
+            self._start_scan(item["file"].rsplit("/", 1)[0])
+        return Response(status_code=200)
+
+    async def notifications(self, websocket):
+        await websocket.accept()
+        self.websockets.add(websocket)
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+        finally:
+            self.websockets.discard(websocket)
+
+
+def _attrs(attrs):
+    return "".join(f" {key}={quoteattr(str(value))}" for key, value in attrs.items())
+
+
+class FakeQBittorrent(FakeServer):
+    """qBittorrent Web API con `torrents` torrent: un terzo senza commento, metà vecchi di 200 giorni."""
+
+    def __init__(self, torrents=1000, latency=0.0):
+        super().__init__(latency)
+        now = int(time.time())
+        self.torrents = {}
+        for index in range(torrents):
+            torrent_hash = f"{index:040x}"
+            self.torrents[torrent_hash] = {
+                "name": f"Torrent {index}",
+                "progress": 1.0 if index % 10 else 0.5,
+                "comment": "" if index % 3 == 0 else "https://tracker.example/torrent",
+                "added_on": now - (200 if index % 2 else 5) * 86400,
+                "state": "stalledUP",
+                "size": 1024 ** 3,
+                "category": "tv-sonarr" if index % 2 else "radarr",
+                "tags": "",
+                "tracker": "https://tracker.example/announce",
+                "ratio": 1.5,
+                "seeding_time": 86400 * 10,
+            }
+        self.rid = 0
+        self.removed = []
+
+    def routes(self):
+        return [
+            Route("/api/v2/auth/login", self.login, methods=["POST"]),
+            Route("/api/v2/sync/maindata", self.maindata),
+            Route("/api/v2/torrents/info", self.info),
+            Route("/api/v2/torrents/delete", self.delete, methods=["POST"]),
+        ]
+
+    async def login(self, request: Request):
+        await self.hit("login")
+        response = PlainTextResponse("Ok.")
+        response.set_cookie("SID", "fakesid")
+        return response
+
+    async def maindata(self, request: Request):
+        await self.hit("sync_maindata")
+        rid = int(request.query_params.get("rid", 0))
+        self.rid += 1
+        if rid == 0:
+            return JSONResponse({"rid": self.rid, "full_update": True, "torrents": self.torrents})
+        removed, self.removed = self.removed, []
+        return JSONResponse({"rid": self.rid, "torrents": {}, "torrents_removed": removed})
+
+    async def info(self, request: Request):
+        await self.hit("torrents_info")
+        return JSONResponse([{"hash": torrent_hash, **torrent} for torrent_hash, torrent in self.torrents.items()])
+
+    async def delete(self, request: Request):
+        await self.hit("torrents_delete")
+        form = urllib.parse.parse_qs((await request.body()).decode())
+        for torrent_hash in form.get("hashes", [""])[0].split("|"):
+            if self.torrents.pop(torrent_hash, None) is not None:
+                self.removed.append(torrent_hash)
+        return Response(status_code=200)
+
+
+class FakeTMDB(FakeServer):
+    """API TMDB per le immagini e CDN image.tmdb.org con immagini da `image_size` byte."""
+
+    def __init__(self, image_size=200 * 1024, latency=0.0):
+        super().__init__(latency)
+        self.image = b"\xff\xd8\xff" + b"\0" * image_size
+
+    def routes(self):
+        return [
+            Route("/3/movie/{tmdb_id}/images", self.movie_images),
+            Route("/3/tv/{tv_id}/season/{season}/episode/{episode}/images", self.episode_images),
+            Route("/t/p/{size}/{file_path:path}", self.image_file),
+        ]
+
+    async def movie_images(self, request: Request):
+        await self.hit("tmdb_images")
+        tmdb_id = request.path_params["tmdb_id"]
+        return JSONResponse({"posters": [{"file_path": f"/poster{tmdb_id}.jpg", "width": 2000, "height": 3000}]})
+
+    async def episode_images(self, request: Request):
+        await self.hit("tmdb_images")
+        params = request.path_params
+        return JSONResponse({"stills": [{"file_path": f"/still{params['tv_id']}s{params['season']}e{params['episode']}.jpg",
+                                         "width": 1920, "height": 1080}]})
+
+    async def image_file(self, request: Request):
+        await self.hit("image_download")
+        return Response(self.image, media_type="image/jpeg")
+
+
+class FakeTelegram(FakeServer):
+    """Telegram Bot API: accetta sendMessage, sendPhoto e sendMediaGroup senza inviare nulla."""
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency)
+        self.message_id = 0
+
+    def routes(self):
+        return [Route("/bot{token}/{method}", self.method, methods=["GET", "POST"])]
+
+    def _message(self):
+        self.message_id += 1
+        return {"message_id": self.message_id, "date": int(time.time()), "chat": {"id": 1, "type": "private"}}
+
+    async def method(self, request: Request):
+        method = request.path_params["method"]
+        await self.hit(method)
+        await request.body()
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "PlexGuard", "username": "plexguard_bot"}
+        elif method == "sendMediaGroup":
+            result = [self._message() for _ in range(2)]
+        else:
+            result = self._message()
+        return Response(json.dumps({"ok": True, "result": result}), media_type="application/json")
+
+
+class FakeKometa(FakeServer):
+    def routes(self):
+        return [Route("/kometa", self.kometa, methods=["POST"])]
+
+    async def kometa(self, request: Request):
+        await self.hit("kometa")
+        return JSONResponse({"status": "started"})
@@ -0,0 +1,311 @@
+"""
+Benchmark di PlexGuard: riproduce webhook contro l'app ASGI di `plexguard.Controller`
+con Plex, qBittorrent, TMDB, Telegram e Kometa sostituiti da server finti in-process.
+
+Esempio:
+    python -m benchmarks.replay --movies 8000 --shows 1500 --count 200 --rate 20 --latency-ms 20
+
+Riporta latenza di risposta dei webhook, latenza end-to-end (invio → job completato),
+throughput e numero di chiamate in uscita per webhook verso ciascun servizio.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fakes import FakeKometa, FakePlex, FakeQBittorrent, FakeTelegram, FakeTMDB, episode_file, movie_file
+from plexguard.RetryLater import RetryLater
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay di webhook contro PlexGuard con servizi finti")
+    parser.add_argument("--movies", type=int, default=1000, help="Film nella libreria Plex finta")
+    parser.add_argument("--shows", type=int, default=100, help="Serie nella libreria Plex finta")
+    parser.add_argument("--seasons", type=int, default=2, help="Stagioni per serie")
+    parser.add_argument("--episodes", type=int, default=10, help="Episodi per stagione")
+    parser.add_argument("--torrents", type=int, default=1000, help="Torrent in qBittorrent")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Latenza iniettata in ogni servizio finto")
+    parser.add_argument("--scan-delay-ms", type=float, default=300,
+                        help="Durata di una scansione del Plex finto: i file importati compaiono solo dopo")
+    parser.add_argument("--no-alerts", action="store_true",
+                        help="Disattiva il websocket delle notifiche Plex (solo polling)")
+    parser.add_argument("--count", type=int, default=100, help="Webhook da inviare (payload sintetici)")
+    parser.add_argument("--rate", type=float, default=10, help="Webhook al secondo")
+    parser.add_argument("--warmup", type=int, default=0, help="Webhook di riscaldamento esclusi dalle misure")
+    parser.add_argument("--payloads", help="File JSONL di payload da riprodurre al posto di quelli sintetici")
+    parser.add_argument("--timeout", type=float, default=300, help="Attesa massima per il completamento dei job")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Stampa il report in JSON")
+    parser.add_argument("--verbose", action="store_true", help="Mostra i log di PlexGuard")
+    return parser.parse_args(argv)
+
+
+def synthetic_payloads(count, args, rng):
+    """
+    Mix di import Radarr, download Radarr e season pack Sonarr su elementi della libreria finta.
+    Gli import sono upgrade con un nuovo file (`movieFile`/`episodeFiles`) e, finché la libreria
+    lo permette, riguardano elementi sempre diversi, come in un import reale.
+    """
+    payloads = []
+    imported = set()
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.6 or not args.shows:
+            endpoint = "/imported" if kind < 0.4 else "/downloading"
+            tmdb_id = rng.randint(1, args.movies)
+            for _ in range(10):
+                if endpoint == "/downloading" or ("movie", tmdb_id) not in imported:
+                    break
+                tmdb_id = rng.randint(1, args.movies)
+            payload = {"eventType": "Download",
+                       "movie": {"tmdbId": tmdb_id, "imdbId": f"tt{tmdb_id:07d}",
+                                 "folderPath": f"/media/movies/Movie {tmdb_id}"}}
+            if endpoint == "/imported":
+                version = 2 + sum(1 for key in imported if key == ("movie", tmdb_id))
+                imported.add(("movie", tmdb_id))
+                payload["isUpgrade"] = True
+                payload["movieFile"] = _file_info(movie_file(tmdb_id, version), version)
+        else:
+            show, season = rng.randint(1, args.shows), rng.randint(1, args.seasons)
+            for _ in range(10):
+                if ("series", show, season) not in imported:
+                    break
+                show, season = rng.randint(1, args.shows), rng.randint(1, args.seasons)
+            version = 2 + sum(1 for key in imported if key == ("series", show, season))
+            imported.add(("series", show, season))
+            first = rng.randint(1, args.episodes)
+            last = rng.randint(first, args.episodes)
+            endpoint = "/imported"
+            payload = {"eventType": "Download", "isUpgrade": True,
+                       "series": {"tmdbId": FakePlex.SHOW_TMDB_OFFSET + show, "path": f"/media/tv/Show {show}"},
+                       "episodes": [{"seasonNumber": season, "episodeNumber": number}
+                                    for number in range(first, last + 1)],
+                       "episodeFiles": [_file_info(episode_file(show, season, number, version), version)
+                                        for number in range(first, last + 1)]}
+        payloads.append((endpoint, payload))
+    return payloads
+
+
+def _file_info(path, version):
+    return {"relativePath": path.rsplit("/", 1)[1], "path": path, "size": 1024 ** 3 + version}
+
+
+def payload_files(payload):
+    """File (percorso, dimensione) che il payload dichiara importati."""
+    files = [payload.get("movieFile"), payload.get("episodeFile"), *(payload.get("episodeFiles") or [])]
+    return [(file["path"], file.get("size") or 0) for file in files if isinstance(file, dict) and file.get("path")]
+
+
+def load_payloads(path):
+    """Legge un JSONL: ogni riga è {"endpoint", "payload"} oppure direttamente il payload (→ /imported)."""
+    payloads = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if "payload" in record:
+                payloads.append((record.get("endpoint", "/imported"), record["payload"]))
+            else:
+                payloads.append(("/imported", record))
+    return payloads
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+def configure_environment(fakes, workdir, args):
+    plex, qbittorrent, tmdb, telegram, kometa = fakes
+    os.environ.update({
+        "PLEX_URL": plex.url,
+        "PLEX_TOKEN": "bench",
+        "PLEX_ALERTS": "false" if args.no_alerts else "true",
+        "QBITTORRENT_URL": qbittorrent.url,
+        "QBITTORRENT_USER": "admin",
+        "QBITTORRENT_PASS": "admin",
+        "TMDB_API_KEY": "bench",
+        "TMDB_API_URL": f"{tmdb.url}/3",
+        "TMDB_IMAGE_URL": f"{tmdb.url}/t/p",
+        "TELEGRAM_BOT_TOKEN": "123:bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "TELEGRAM_API_URL": f"{telegram.url}/bot",
+        "TELEGRAM_RATE_PER_SECOND": "1000",
+        "TELEGRAM_BURST": "1000",
+        "KOMETA_URL": f"{kometa.url}/kometa",
+        "KOMETA_QUIET_SECONDS": "0.5",
+        "CLEAN_DEBOUNCE_SECONDS": "1",
+        "IMPORT_WAIT_TIMEOUT": "10",
+        "WEBHOOK_QUEUE_SIZE": str(max(1000, args.count + args.warmup)),
+        "AUDIO_TRACKS_DB": os.path.join(workdir, "audio_tracks.db"),
+        "AUDIO_TRACKS_JSON": os.path.join(workdir, "audio_tracks.json"),
+        "PLEX_GUID_INDEX": os.path.join(workdir, "plex_guid_index.json"),
+        "IMAGE_CACHE_DIR": os.path.join(workdir, "image_cache"),
+        "LEADER_LOCK_FILE": os.path.join(workdir, "plexguard.leader.lock"),
+    })
+
+
+async def replay(controller, plex, payloads, rate, timeout):
+    """
+    Invia i payload al ritmo `rate` e attende che tutti i job accettati siano completati.
+    Prima di ogni import i file del payload vengono scritti nel Plex finto, come fanno Radarr e Sonarr.
+    """
+    completed = {}
+
+    def track(handler):
+        async def wrapper(data):
+            deferred = False
+            try:
+                return await handler(data)
+            except RetryLater:
+                # Job rimandato in attesa di Plex: non è ancora completato
+                deferred = True
+                raise
+            finally:
+                if not deferred:
+                    completed[data.get("_bench_id")] = time.perf_counter()
+        return wrapper
+
+    original_handlers = controller.handle_downloading, controller.handle_imported
+    controller.handle_downloading = track(original_handlers[0])
+    controller.handle_imported = track(original_handlers[1])
+
+    sent_at = {}
+    response_times = []
+    statuses = {}
+    transport = httpx.ASGITransport(app=controller.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://plexguard") as client:
+            async def send(index, endpoint, payload):
+                await asyncio.sleep(max(0.0, started + index / rate - time.perf_counter()))
+                payload = dict(payload, _bench_id=index)
+                for path, size in payload_files(payload):
+                    plex.write_file(path, size)
+                sent_at[index] = time.perf_counter()
+                response = await client.post(endpoint, json=payload)
+                response_times.append(time.perf_counter() - sent_at[index])
+                statuses[index] = response.status_code
+
+            started = time.perf_counter()
+            await asyncio.gather(*(send(index, endpoint, payload) for index, (endpoint, payload) in enumerate(payloads)))
+
+        accepted = {index for index, status in statuses.items() if status == 202}
+        deadline = time.perf_counter() + timeout
+        while not accepted <= completed.keys() and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+    finally:
+        controller.handle_downloading, controller.handle_imported = original_handlers
+
+    end_to_end = [completed[index] - sent_at[index] for index in accepted if index in completed]
+    finished_at = max((completed[index] for index in accepted if index in completed), default=time.perf_counter())
+    return {
+        "sent": len(payloads),
+        "accepted": len(accepted),
+        "completed": len(end_to_end),
+        "statuses": {str(status): list(statuses.values()).count(status) for status in set(statuses.values())},
+        "response_times": response_times,
+        "end_to_end": end_to_end,
+        "duration": finished_at - started,
+    }
+
+
+def report(result, fakes, as_json):
+    completed = result["completed"] or 1
+    outbound = {}
+    for fake in fakes:
+        name = type(fake).__name__.replace("Fake", "")
+        outbound[name] = {call: round(count / completed, 2) for call, count in sorted(fake.calls.items())}
+        outbound[name]["total"] = round(sum(fake.calls.values()) / completed, 2)
+
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    summary = {
+        "sent": result["sent"],
+        "accepted": result["accepted"],
+        "completed": result["completed"],
+        "statuses": result["statuses"],
+        "response_ms": {"p50": ms(percentile(result["response_times"], 0.5)),
+                        "p99": ms(percentile(result["response_times"], 0.99))},
+        "end_to_end_ms": {"p50": ms(percentile(result["end_to_end"], 0.5)),
+                          "p99": ms(percentile(result["end_to_end"], 0.99)),
+                          "mean": ms(statistics.mean(result["end_to_end"])) if result["end_to_end"] else None},
+        "throughput_per_s": round(result["completed"] / result["duration"], 2) if result["duration"] else None,
+        "outbound_calls_per_webhook": outbound,
+    }
+    if as_json:
+        print(json.dumps(summary, indent=2))
+        return summary
+
+    print(f"Webhook inviati: {summary['sent']}  accettati: {summary['accepted']}  "
+          f"completati: {summary['completed']}  status: {summary['statuses']}")
+    print(f"Risposta HTTP   p50 {summary['response_ms']['p50']} ms   p99 {summary['response_ms']['p99']} ms")
+    print(f"End-to-end      p50 {summary['end_to_end_ms']['p50']} ms   p99 {summary['end_to_end_ms']['p99']} ms")
+    print(f"Throughput      {summary['throughput_per_s']} webhook/s")
+    print("Chiamate in uscita per webhook:")
+    for name, calls in outbound.items():
+        details = ", ".join(f"{call}={count}" for call, count in calls.items() if call != "total")
+        print(f"  {name:<12} {calls['total']:>8}   {details}")
+    return summary
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    latency = args.latency_ms / 1000
+    fakes = [
+        FakePlex(args.movies, args.shows, args.seasons, args.episodes, latency=latency,
+                 scan_delay=args.scan_delay_ms / 1000),
+        FakeQBittorrent(args.torrents, latency=latency),
+        FakeTMDB(latency=latency),
+        FakeTelegram(latency=latency),
+        FakeKometa(latency=latency),
+    ]
+    for fake in fakes:
+        fake.start()
+
+    payloads = load_payloads(args.payloads) if args.payloads else synthetic_payloads(args.count, args, rng)
+
+    with tempfile.TemporaryDirectory(prefix="plexguard-bench-") as workdir:
+        configure_environment(fakes, workdir, args)
+        controller = importlib.import_module("plexguard.Controller")
+        try:
+            async with controller.app.router.lifespan_context(controller.app):
+                if args.warmup:
+                    await replay(controller, fakes[0], synthetic_payloads(args.warmup, args, rng), args.rate,
+                                 args.timeout)
+                    for fake in fakes:
+                        fake.reset_calls()
+                result = await replay(controller, fakes[0], payloads, args.rate, args.timeout)
+                # Lascia partire i trigger Kometa e la pulizia dei torrent ancora in sospeso
+                await asyncio.sleep(1)
+        finally:
+            for fake in fakes:
+                fake.stop()
+    return report(result, fakes, args.json)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    summary = asyncio.run(run(args))
+    return 0 if summary["completed"] == summary["accepted"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
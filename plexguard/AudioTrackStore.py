@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+AUDIO_TRACKS_DB = Path(os.getenv("AUDIO_TRACKS_DB", "audio_tracks.db"))
+# Vecchio database JSON, importato una sola volta alla prima apertura
+AUDIO_TRACKS_JSON = Path(os.getenv("AUDIO_TRACKS_JSON", "audio_tracks.json"))
+
+
+class AudioTrackStore:
+    """
+    Archivio delle tracce audio note per ogni media, su SQLite in modalità WAL.
+
+    Ogni riga associa l'id del media (tmdbId per i film, "<tmdbId>-sXXeYY" per gli episodi)
+    alla lista delle lingue audio. Letture puntuali e upsert a blocchi evitano di riscrivere
+    l'intero database a ogni webhook.
+    """
+
+    def __init__(self, path=AUDIO_TRACKS_DB, legacy_json=AUDIO_TRACKS_JSON):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS audio_tracks ("
+                " media_id TEXT PRIMARY KEY,"
+                " languages TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._migrate_from_json(Path(legacy_json))
+
+    def _migrate_from_json(self, legacy_json):
+        """Importa una sola volta il vecchio audio_tracks.json, se presente."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone()
+        if row or not legacy_json.exists():
+            return
+
+        try:
+            with open(legacy_json, "r", encoding="utf-8") as f:
+                content = f.read().strip()
+            audio_db = json.loads(content) if content else {}
+        except Exception as e:
+            logger.error("❌ Errore nella lettura di %s per la migrazione: %s", legacy_json, e)
+            return
+
+        self.upsert_many(audio_db)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                               (str(time.time()),))
+        logger.info("📦 Migrate %d voci da %s a %s", len(audio_db), legacy_json, self.path)
+
+    def get_many(self, media_ids):
+        """Restituisce un dizionario media_id → lingue per gli id presenti."""
+        media_ids = [str(media_id) for media_id in media_ids]
+        if not media_ids:
+            return {}
+        placeholders = ",".join("?" * len(media_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT media_id, languages FROM audio_tracks WHERE media_id IN ({placeholders})",
+                media_ids).fetchall()
+        return {media_id: json.loads(languages) for media_id, languages in rows}
+
+    def upsert_many(self, languages_by_id):
+        """Salva in un'unica transazione le lingue di più media."""
+        if not languages_by_id:
+            return
+        now = time.time()
+        rows = [(str(media_id), json.dumps(languages), now) for media_id, languages in languages_by_id.items()]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO audio_tracks (media_id, languages, updated_at) VALUES (?, ?, ?)"
+                " ON CONFLICT(media_id) DO UPDATE SET languages = excluded.languages,"
+                " updated_at = excluded.updated_at",
+                rows)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM audio_tracks").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,218 @@
+"""
+Popola il database delle tracce audio con tutti i film e gli episodi già presenti su Plex.
+
+Senza backfill il primo import di un elemento già in libreria sembra sempre "nuovo" e genera
+una notifica. Esempio:
+    python -m plexguard.Backfill --workers 8
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from plexguard.TelegramNotificationService import TelegramNotificationService
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHECKPOINT = Path(os.getenv("BACKFILL_CHECKPOINT", "backfill_checkpoint.json"))
+
+SECTION_TYPES = ("movie", "show")
+
+
+def tmdb_id_of(item):
+    """tmdbId di un film o di una serie, letto dai GUID di Plex (None se assente)."""
+    for guid in item.guids:
+        if guid.id.startswith("tmdb://"):
+            return guid.id[len("tmdb://"):]
+    return None
+
+
+class Checkpoint:
+    """Elementi (ratingKey di film e serie) già salvati, per riprendere un backfill interrotto."""
+
+    def __init__(self, path=BACKFILL_CHECKPOINT):
+        self.path = Path(path)
+        self.done = set()
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.done = set(json.load(f).get("done", []))
+            logger.info("📍 Checkpoint caricato da %s: %d elementi già elaborati", self.path, len(self.done))
+        except FileNotFoundError:
+            pass
+
+    def mark(self, rating_keys):
+        with self._lock:
+            self.done.update(rating_keys)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"done": sorted(self.done)}, f)
+            os.replace(tmp_path, self.path)
+
+    def reset(self):
+        self.done = set()
+        self.path.unlink(missing_ok=True)
+
+
+class Backfill:
+    """
+    Scorre le sezioni film e serie di Plex ed estrae le lingue audio come per i webhook
+    (`TelegramNotificationService._audio_languages`), con un pool limitato di thread.
+    I risultati vengono scritti a blocchi con `upsert_many` e il checkpoint viene aggiornato
+    dopo ogni blocco, così un backfill interrotto riparte dagli elementi mancanti.
+    """
+
+    def __init__(self, service, checkpoint, workers=8, batch_size=500, overwrite=False):
+        self.service = service
+        self.audio_store = service.audio_store
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.batch_size = batch_size
+        self.overwrite = overwrite
+        self.saved = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def _missing(self, media_ids):
+        """Id ancora da elaborare: tutti con --overwrite, altrimenti quelli non presenti nel database."""
+        if self.overwrite:
+            return set(media_ids)
+        return set(media_ids) - set(self.audio_store.get_many(media_ids))
+
+    def _movie_languages(self, movie):
+        tmdb_id = tmdb_id_of(movie)
+        if not tmdb_id or not self._missing([tmdb_id]):
+            return {}
+        languages = self.service._audio_languages(movie, refresh=False)
+        return {tmdb_id: languages} if languages else {}
+
+    def _show_languages(self, show):
+        tmdb_id = tmdb_id_of(show)
+        if not tmdb_id:
+            return {}
+        episodes = {f"{tmdb_id}-{episode.seasonEpisode}": episode for episode in show.episodes()}
+        missing = self._missing(episodes)
+        results = {}
+        for media_id, episode in episodes.items():
+            if media_id not in missing:
+                continue
+            languages = self.service._audio_languages(episode, refresh=False)
+            if languages:
+                results[media_id] = languages
+        return results
+
+    def run(self, section_names=None):
+        plex = self.service._get_plex()
+        if plex is None:
+            logger.error("❌ Plex non raggiungibile: backfill annullato")
+            return False
+
+        sections = [section for section in plex.library.sections() if section.type in SECTION_TYPES
+                    and (not section_names or section.title in section_names)]
+        started_at = time.monotonic()
+        for section in sections:
+            self._run_section(section)
+        logger.info("🏁 Backfill completato in %.0fs: %d media salvati, %d elementi già elaborati, %d errori",
+                    time.monotonic() - started_at, self.saved, self.skipped, self.failed)
+        return self.failed == 0
+
+    def _run_section(self, section):
+        all_items = section.search()
+        items = [item for item in all_items if str(item.ratingKey) not in self.checkpoint.done]
+        self.skipped += len(all_items) - len(items)
+        total = len(items)
+        logger.info("📚 Sezione '%s': %d elementi da elaborare", section.title, total)
+        if not total:
+            return
+
+        extract = self._movie_languages if section.type == "movie" else self._show_languages
+        pending_languages = {}
+        pending_keys = []
+        processed = 0
+        started_at = last_report = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # Al massimo 2 × workers elementi in volo, per non tenere in memoria l'intera sezione come future
+            items_iter = iter(items)
+            in_flight = {}
+            for item in items_iter:
+                in_flight[executor.submit(extract, item)] = item
+                if len(in_flight) >= self.workers * 2:
+                    break
+
+            while in_flight:
+                completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    item = in_flight.pop(future)
+                    processed += 1
+                    try:
+                        pending_languages.update(future.result())
+                        pending_keys.append(str(item.ratingKey))
+                    except Exception as e:
+                        self.failed += 1
+                        logger.error("❌ Errore nell'elaborazione di '%s': %s", item.title, e)
+
+                    next_item = next(items_iter, None)
+                    if next_item is not None:
+                        in_flight[executor.submit(extract, next_item)] = next_item
+
+                if len(pending_languages) >= self.batch_size or len(pending_keys) >= self.batch_size:
+                    self._flush(pending_languages, pending_keys)
+
+                now = time.monotonic()
+                if now - last_report >= 5 or not in_flight:
+                    rate = processed / (now - started_at) if now > started_at else 0
+                    eta = (total - processed) / rate if rate else 0
+                    logger.info("⏳ '%s': %d/%d (%.1f%%), %.1f elementi/s, ETA %.0fs",
+                                section.title, processed, total, 100 * processed / total, rate, eta)
+                    last_report = now
+
+        self._flush(pending_languages, pending_keys)
+
+    def _flush(self, pending_languages, pending_keys):
+        """Scrive un blocco di risultati e solo dopo segna gli elementi nel checkpoint."""
+        self.audio_store.upsert_many(pending_languages)
+        self.checkpoint.mark(pending_keys)
+        self.saved += len(pending_languages)
+        pending_languages.clear()
+        pending_keys.clear()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill del database delle tracce audio da Plex")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BACKFILL_WORKERS", 8)),
+                        help="Richieste a Plex in parallelo")
+    parser.add_argument("--batch-size", type=int, default=500, help="Media scritti per transazione")
+    parser.add_argument("--checkpoint", default=BACKFILL_CHECKPOINT, help="File di checkpoint per la ripresa")
+    parser.add_argument("--section", action="append", help="Limita il backfill a questa sezione (ripetibile)")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="Sovrascrive anche i media già presenti nel database")
+    parser.add_argument("--restart", action="store_true", help="Ignora il checkpoint e riparte da zero")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    service = TelegramNotificationService()
+    # Il backfill non ha bisogno delle notifiche in tempo reale di Plex
+    service.plex_alerts_enabled = False
+    checkpoint = Checkpoint(args.checkpoint)
+    if args.restart:
+        checkpoint.reset()
+
+    backfill = Backfill(service, checkpoint, workers=args.workers, batch_size=args.batch_size,
+                        overwrite=args.overwrite)
+    try:
+        ok = backfill.run(args.section)
+    finally:
+        service.audio_store.close()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
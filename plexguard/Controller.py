@@ -1,45 +1,246 @@
+import asyncio
+import contextlib
 import logging
+import os
 
-import uvicorn
 from starlette.applications import Starlette
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 from starlette.routing import Route
 
-from plexguard.TelegramNotificationService import TelegramNotificationService
+from plexguard import Metrics
+from plexguard.HealthCheck import HealthCheck
+from plexguard.LeaderLease import LeaderLease
+from plexguard.LeaderRequests import LeaderRequests
+from plexguard.RetryLater import RetryLater
+from plexguard.TelegramNotificationService import SCAN_REQUESTED_AT, TelegramNotificationService
+from plexguard.TorrentCleanerScheduler import TorrentCleanerScheduler
 from plexguard.TorrentCleanerService import TorrentCleanerService
+from plexguard.WebhookDeduplicator import DONE, WebhookDeduplicator
+from plexguard.WebhookWorkerPool import WebhookWorkerPool
 
 logger = logging.getLogger(__name__)
 
-# Inizializza i servizi
+# Richieste inoltrate al leader dagli altri worker
+CLEAN_REQUEST = "clean"
+GUID_SYNC_REQUEST = "guid_sync"
+KOMETA_REQUEST_PREFIX = "kometa:"
+LEADER_POLL_SECONDS = float(os.getenv("LEADER_POLL_SECONDS", 2))
+
+# Inizializza i servizi: nessuna connessione di rete qui, le dipendenze vengono contattate
+# al primo utilizzo o dal warm-up in background avviato dal lifespan. Il server va avviato con
+# `python -m plexguard`, che non importa questo modulo nel processo principale
+
 torrent_cleaner = TorrentCleanerService()
 telegram_notifier = TelegramNotificationService()
+cleaner_scheduler = TorrentCleanerScheduler(torrent_cleaner)
+deduplicator = WebhookDeduplicator()
+health = HealthCheck()
+leader_lease = LeaderLease()
+leader_requests = LeaderRequests()
+# Finché questo processo non è leader, gli avvii di Kometa e le sincronizzazioni dell'indice
+# GUID Plex vengono inoltrati al leader
+telegram_notifier.kometa.delegate = lambda library: leader_requests.request(KOMETA_REQUEST_PREFIX + library)
+telegram_notifier.guid_index.delegate = lambda: leader_requests.request(GUID_SYNC_REQUEST)
+
+
+def _instrument_services():
+    """Misura le fasi esterne dell'elaborazione dei webhook (vedi /metrics)."""
+    stages = [
+        (telegram_notifier, "_refresh_library", "plex_scan"),
+        (telegram_notifier, "resolve_media", "plex_lookup"),
+        (telegram_notifier, "_stream_languages", "plex_streams"),
+        (telegram_notifier, "get_tmdb_image_url", "tmdb"),
+        (telegram_notifier, "download_image", "image_download"),
+        (telegram_notifier, "_send_with_retry", "telegram"),
+        (telegram_notifier.guid_index, "sync", "plex_guid_index_sync"),
+        (telegram_notifier.audio_store, "upsert_many", "audio_db_write"),
+        (telegram_notifier.kometa, "start_kometa", "kometa"),
+        (torrent_cleaner, "clean_torrents", "clean_torrents"),
+        (torrent_cleaner, "sync", "qbittorrent_sync"),
+        (torrent_cleaner, "delete_torrents", "qbittorrent_delete"),
+    ]
+    for service, method_name, stage in stages:
+        Metrics.instrument(service, method_name, stage)
+
+
+# Stati dei torrent già esportati, da riportare a 0 quando spariscono
+_torrent_states = set()
+
+
+def _update_gauges():
+    Metrics.QUEUE_DEPTH.set(worker_pool.depth)
+    Metrics.AUDIO_DB_ENTRIES.set(telegram_notifier.audio_store.count())
+    # Solo il leader pulisce i torrent, quindi solo il suo mirror è aggiornato
+    if not leader_lease.is_leader:
+        return
+    states = {}
+    for torrent in list(torrent_cleaner.torrents.values()):
+        state = torrent.get("state", "unknown")
+        states[state] = states.get(state, 0) + 1
+    # Niente clear(): con più worker i valori rimossi resterebbero nei file di prometheus_client
+    for state in _torrent_states - states.keys():
+        Metrics.QBITTORRENT_TORRENTS.labels(state).set(0)
+    for state, count in states.items():
+        Metrics.QBITTORRENT_TORRENTS.labels(state).set(count)
+    _torrent_states.update(states)
+
+
+_instrument_services()
+Metrics.add_scrape_hook(_update_gauges)
+
+
+async def request_cleaning():
+    """Chiede una passata di pulizia dei torrent al leader (direttamente, se è questo processo)."""
+    if leader_lease.is_leader:
+        cleaner_scheduler.mark_dirty()
+    else:
+        await asyncio.to_thread(leader_requests.request, CLEAN_REQUEST)
+
+
+@Metrics.timed("job_downloading")
+async def handle_downloading(data):
+    """Job in background per il webhook /downloading."""
+    await request_cleaning()
+    return await asyncio.to_thread(telegram_notifier.process_downloading, data)
+
+
+@Metrics.timed("job_imported")
+async def handle_imported(data):
+    """Job in background per il webhook /imported (ripreso dopo `RetryLater` finché Plex non è pronto)."""
+    if SCAN_REQUESTED_AT not in data:
+        await request_cleaning()
+    return await telegram_notifier.process_imported(data)
+
+
+async def run_job(job):
+    """Esegue un job della coda persistente e ne registra l'esito per la deduplica."""
+    handlers = {"downloading": handle_downloading, "imported": handle_imported}
+    fingerprint = job["fingerprint"]
+    try:
+        result = await handlers[job["name"]](job["data"])
+    except RetryLater:
+        raise
+    except Exception:
+        # All'ultimo tentativo l'evento viene dimenticato, così un reinvio verrà elaborato
+        if fingerprint and job["attempts"] >= worker_pool.max_attempts:
+            await asyncio.to_thread(deduplicator.forget, fingerprint)
+        raise
+    if fingerprint:
+        await asyncio.to_thread(deduplicator.complete, fingerprint, result)
+    return result
+
+
+worker_pool = WebhookWorkerPool(run_job)
+
+
+async def wake_on_plex_alerts():
+    """Anticipa i job in attesa di Plex quando Plex segnala la fine di una scansione."""
+    while True:
+        if await telegram_notifier.alert_listener.wait(None):
+            await worker_pool.wake_deferred()
+
+
+def _database_health():
+    return {"status": "ok", "audio_tracks": telegram_notifier.audio_store.count(), "pending_jobs": worker_pool.depth}
+
+
+health.add("database", _database_health, required=True)
+health.add("plex", telegram_notifier.plex_health)
+health.add("qbittorrent", torrent_cleaner.health)
+health.add("telegram", telegram_notifier.telegram_health)
+health.add("leader", lambda: {"status": "ok", "leader": leader_lease.is_leader, "pid": os.getpid()})
+
+
+async def lead():
+    """
+    Attende di diventare leader, poi esegue per tutti i worker la pulizia dei torrent, gli
+    avvii di Kometa e la sincronizzazione dell'indice GUID Plex, servendo le richieste che
+    gli altri processi hanno inoltrato.
+    """
+    await leader_lease.acquire()
+    telegram_notifier.kometa.delegate = None
+    telegram_notifier.guid_index.delegate = None
+    await cleaner_scheduler.start()
+    guid_sync = None
+    while True:
+        for name in await asyncio.to_thread(leader_requests.take):
+            if name == CLEAN_REQUEST:
+                cleaner_scheduler.mark_dirty()
+            elif name == GUID_SYNC_REQUEST:
+                # Una sola sincronizzazione alla volta; la costruzione iniziale può essere lunga
+                if guid_sync is None or guid_sync.done():
+                    guid_sync = asyncio.create_task(asyncio.to_thread(telegram_notifier.sync_guid_index))
+            elif name.startswith(KOMETA_REQUEST_PREFIX):
+                telegram_notifier.kometa.trigger(name[len(KOMETA_REQUEST_PREFIX):])
+        await asyncio.sleep(LEADER_POLL_SECONDS)
+
+
+def _reply(name, content, status_code):
+    Metrics.WEBHOOK_REQUESTS.labels(name, str(status_code)).inc()
+    return JSONResponse(content, status_code=status_code)
+
+
+async def _enqueue(request: Request, name):
+    try:
+        data = await request.json()
+    except ValueError:
+        return _reply(name, {"status": "KO", "error": "Payload JSON non valido"}, 400)
+    if not isinstance(data, dict):
+        return _reply(name, {"status": "KO", "error": "Il payload deve essere un oggetto JSON"}, 400)
+
+    logger.info("DATA: %s", data)
+    fingerprint, event = await asyncio.to_thread(deduplicator.claim, name, data)
+    if event is not None:
+        logger.info("🔁 Webhook '%s' già ricevuto (%s): non viene rielaborato", name, event["status"])
+        return _reply(name, {"status": "DUPLICATE", "processing": event["status"] != DONE,
+                             "result": event["result"]}, 200)
+
+    if not await worker_pool.submit(name, data, fingerprint):
+        await asyncio.to_thread(deduplicator.forget, fingerprint)
+        return _reply(name, {"status": "KO", "error": "Coda piena, riprovare"}, 503)
+    queued = await asyncio.to_thread(worker_pool.store.pending)
+    return _reply(name, {"status": "ACCEPTED", "queued": queued}, 202)
 
 
 async def downloading(request: Request):
     """Webhook di Sonarr: Notifica il download in corso."""
-    data = await request.json()
-    logger.info("DATA: %s", data)
-    torrent_cleaner.clean_torrents()
-    result = telegram_notifier.process_downloading(data)
-    return JSONResponse({"status": "OK", "result": result})
+    return await _enqueue(request, "downloading")
 
 
 async def imported(request: Request):
     """Webhook di Sonarr: Verifica se è stata aggiunta una nuova lingua."""
-    data = await request.json()
-    logger.info("DATA: %s", data)
-    torrent_cleaner.clean_torrents()
-    result = await telegram_notifier.process_imported(data)
-    return JSONResponse({"status": "OK", "result": result})
+    return await _enqueue(request, "imported")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await worker_pool.start()
+    leader_task = asyncio.create_task(lead())
+    alerts_task = asyncio.create_task(wake_on_plex_alerts())
+    health.start_warm_up(telegram_notifier.warm_up, torrent_cleaner.sync)
+    try:
+        yield
+    finally:
+        leader_task.cancel()
+        alerts_task.cancel()
+        await asyncio.gather(leader_task, alerts_task, return_exceptions=True)
+        await health.stop()
+        await cleaner_scheduler.stop()
+        await worker_pool.stop()
+        await telegram_notifier.aclose()
+        leader_lease.release()
+        leader_requests.close()
+        worker_pool.store.close()
+        deduplicator.close()
 
 
 routes = [
     Route("/downloading", endpoint=downloading, methods=["POST"]),
     Route("/imported", endpoint=imported, methods=["POST"]),
+    Route("/metrics", endpoint=Metrics.metrics, methods=["GET"]),
+    Route("/healthz", endpoint=health.healthz, methods=["GET"]),
+    Route("/readyz", endpoint=health.readyz, methods=["GET"]),
 ]
 
-app = Starlette(debug=False, routes=routes)
-
-if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=5001)
+app = Starlette(debug=False, routes=routes, lifespan=lifespan)
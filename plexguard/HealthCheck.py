@@ -0,0 +1,107 @@
+import asyncio
+import inspect
+import logging
+import os
+import time
+
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+class HealthCheck:
+    """
+    Stato delle dipendenze di PlexGuard per gli endpoint /healthz e /readyz.
+
+    Il warm-up (connessioni, indice GUID, database) gira in background dopo l'avvio, così
+    la porta HTTP è subito in ascolto; /readyz risponde 503 finché non è concluso o se una
+    dipendenza `required` non funziona. Le sonde delle altre dipendenze (Plex, qBittorrent,
+    Telegram) sono solo riportate: i webhook vengono comunque accodati e ritentati.
+    """
+
+    def __init__(self, timeout=None, cache_seconds=None):
+        self.timeout = timeout or float(os.getenv("HEALTHCHECK_TIMEOUT", 10))
+        # Le sonde vengono ripetute al massimo ogni `cache_seconds` secondi
+        self.cache_seconds = cache_seconds if cache_seconds is not None else float(
+            os.getenv("HEALTHCHECK_CACHE_SECONDS", 15))
+        self.started_at = time.time()
+        self.warmed_up = False
+        self._probes = {}
+        self._required = set()
+        self._results = {}
+        self._checked_at = 0.0
+        self._check_lock = None
+        self._warm_up_task = None
+
+    def add(self, name, probe, required=False):
+        """
+        Registra la sonda `probe` (funzione sincrona o asincrona) che restituisce un dizionario
+        con almeno `status` ("ok", "disabled" o "error"); un'eccezione vale come "error".
+        """
+        self._probes[name] = probe
+        if required:
+            self._required.add(name)
+
+    def start_warm_up(self, *steps):
+        """Avvia in background i passi di warm-up (funzioni sincrone o coroutine) in parallelo."""
+        self._check_lock = asyncio.Lock()
+        self._warm_up_task = asyncio.create_task(self._warm_up(steps))
+
+    async def stop(self):
+        if self._warm_up_task:
+            self._warm_up_task.cancel()
+            await asyncio.gather(self._warm_up_task, return_exceptions=True)
+            self._warm_up_task = None
+
+    @staticmethod
+    async def _call(func, timeout=None):
+        if inspect.iscoroutinefunction(func):
+            return await asyncio.wait_for(func(), timeout)
+        return await asyncio.wait_for(asyncio.to_thread(func), timeout)
+
+    async def _warm_up(self, steps):
+        started_at = time.perf_counter()
+        outcomes = await asyncio.gather(*(self._call(step) for step in steps), return_exceptions=True)
+        for step, outcome in zip(steps, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.warning("⚠️ Warm-up '%s' non riuscito: %s", getattr(step, "__name__", step), outcome)
+        await self.check(force=True)
+        self.warmed_up = True
+        logger.info("🔥 Warm-up completato in %.1fs", time.perf_counter() - started_at)
+
+    async def _probe(self, name, probe):
+        try:
+            result = await self._call(probe, self.timeout)
+        except asyncio.TimeoutError:
+            return {"status": "error", "error": f"Nessuna risposta entro {self.timeout:.0f}s"}
+        except Exception as e:
+            return {"status": "error", "error": str(e) or type(e).__name__}
+        return result or {"status": "ok"}
+
+    async def check(self, force=False):
+        """Esegue tutte le sonde in parallelo, riusando i risultati recenti."""
+        async with self._check_lock:
+            if force or time.monotonic() - self._checked_at >= self.cache_seconds:
+                names = list(self._probes)
+                results = await asyncio.gather(*(self._probe(name, self._probes[name]) for name in names))
+                self._results = dict(zip(names, results))
+                self._checked_at = time.monotonic()
+        return self._results
+
+    @property
+    def ready(self):
+        return self.warmed_up and all(self._results.get(name, {}).get("status") == "ok" for name in self._required)
+
+    async def healthz(self, request):
+        """Liveness: il processo risponde."""
+        return JSONResponse({"status": "ok", "uptime": round(time.time() - self.started_at)})
+
+    async def readyz(self, request):
+        """Readiness: warm-up concluso e stato di ogni dipendenza."""
+        if self.warmed_up:
+            await self.check()
+        dependencies = self._results
+        degraded = any(result.get("status") == "error" for result in dependencies.values())
+        status = "ready" if self.ready else "starting" if not self.warmed_up else "unavailable"
+        return JSONResponse({"status": status, "degraded": degraded, "dependencies": dependencies},
+                            status_code=200 if self.ready else 503)
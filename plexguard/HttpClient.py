@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import os
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Risposte per cui ha senso ritentare la richiesta
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HttpClient:
+    """
+    Client HTTP asincrono condiviso per le chiamate esterne (TMDB, immagini, Kometa).
+
+    Mantiene le connessioni aperte (keep-alive), limita le richieste contemporanee verso
+    lo stesso host, applica un timeout e ritenta con backoff esponenziale gli errori di
+    rete e le risposte 429/5xx (rispettando l'header Retry-After, se presente).
+    Le richieste non idempotenti (`idempotent=False`) vengono ritentate solo se la
+    connessione non è riuscita, cioè quando il server non può averle ricevute.
+    """
+
+    def __init__(self, timeout=None, retries=None, backoff=None, per_host_limit=None, max_connections=None):
+        self.timeout = timeout or float(os.getenv("HTTP_TIMEOUT", 15))
+        self.retries = retries if retries is not None else int(os.getenv("HTTP_RETRIES", 3))
+        self.backoff = backoff or float(os.getenv("HTTP_RETRY_BACKOFF", 0.5))
+        self.per_host_limit = per_host_limit or int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", 10))
+        self.max_connections = max_connections or int(os.getenv("HTTP_MAX_CONNECTIONS", 50))
+        self._client = None
+        self._host_limits = {}
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+                follow_redirects=True,
+            )
+        return self._client
+
+    def _host_limit(self, url):
+        host = httpx.URL(url).host
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_limits[host]
+
+    def _retry_delay(self, attempt, response=None):
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        return self.backoff * 2 ** attempt
+
+    async def request(self, method, url, idempotent=True, **kwargs):
+        limit = self._host_limit(url)
+        retryable = httpx.TransportError if idempotent else (httpx.ConnectError, httpx.ConnectTimeout)
+        attempt = 0
+        while True:
+            try:
+                async with limit:
+                    response = await self._get_client().request(method, url, **kwargs)
+            except retryable as e:
+                if attempt >= self.retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logger.warning("⚠️ Errore di rete verso %s (%s), nuovo tentativo tra %.1fs", url, e, delay)
+            else:
+                if not idempotent or response.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return response
+                delay = self._retry_delay(attempt, response)
+                logger.warning("⚠️ %s ha risposto %d, nuovo tentativo tra %.1fs", url, response.status_code, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,77 @@
+import hashlib
+import logging
+import os
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = Path(os.getenv("IMAGE_CACHE_DIR", "image_cache"))
+
+
+class DiskImageCache:
+    """
+    Cache su disco dei byte delle immagini, indicizzata per URL e limitata a `max_bytes`.
+    Quando lo spazio è esaurito vengono eliminati i file usati meno di recente (mtime).
+    """
+
+    def __init__(self, directory=IMAGE_CACHE_DIR, max_bytes=200 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, url):
+        return self.directory / f"{hashlib.sha1(url.encode()).hexdigest()}.img"
+
+    def get(self, url):
+        path = self._path(url)
+        try:
+            content = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        # Aggiorna l'mtime: è il riferimento per l'eliminazione LRU
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Eliminata nel frattempo da un altro worker
+            pass
+        return content
+
+    def put(self, url, content):
+        if len(content) > self.max_bytes:
+            return
+        path = self._path(url)
+        # Nome temporaneo per processo: più worker possono scrivere la stessa immagine
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with self._lock:
+            tmp_path.write_bytes(content)
+            os.replace(tmp_path, path)
+            self._evict()
+
+    def _files(self):
+        """Immagini presenti su disco come (mtime, dimensione, percorso), dalla meno recente."""
+        files = []
+        for path in self.directory.glob("*.img"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return sorted(files, key=lambda file: file[0])
+
+    def _evict(self):
+        # La cartella è condivisa da tutti i worker: l'occupazione si legge sempre dal disco,
+        # non da un contatore del singolo processo che non vede le scritture degli altri
+        files = self._files()
+        size = sum(file_size for mtime, file_size, path in files)
+        for mtime, file_size, path in files:
+            if size <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+                logger.debug("🧹 Immagine rimossa dalla cache: %s", path.name)
+            except FileNotFoundError:
+                # Già eliminata da un altro worker
+                pass
+            size -= file_size
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class KometaTrigger:
+    """
+    Avvia Kometa raggruppando le richieste per libreria.
+
+    Ogni richiesta riavvia la finestra di quiete della libreria: Kometa parte solo dopo
+    `quiet_window` secondi senza nuove richieste, quindi un import massivo produce un solo
+    avvio. Per ogni libreria è in corso al massimo un avvio alla volta.
+
+    Con più worker solo il leader avvia Kometa: negli altri processi `delegate` inoltra la
+    richiesta al leader invece di programmare l'avvio in locale. `delegate` è una funzione
+    bloccante (scrittura su SQLite) e viene eseguita in un thread.
+
+    La POST a Kometa avvia un'esecuzione e non viene mai ripetuta se la connessione è
+    riuscita: un timeout in lettura o un 5xx non garantiscono che Kometa non sia partito.
+    """
+
+    def __init__(self, http_client, url=None, quiet_window=None, read_timeout=None):
+        self.http = http_client
+        self.url = url if url is not None else os.getenv("KOMETA_URL", "http://192.168.1.10:5009/kometa")
+        self.read_timeout = read_timeout or float(os.getenv("KOMETA_READ_TIMEOUT", 600))
+        self.quiet_window = quiet_window if quiet_window is not None else float(os.getenv("KOMETA_QUIET_SECONDS", 120))
+        self._pending = {}
+        self._locks = {}
+        self._delegated = set()
+        self.delegate = None
+        if not self.url:
+            logger.info("ℹ️ KOMETA_URL vuoto: Kometa non verrà avviato")
+
+    def trigger(self, library):
+        """Programma l'avvio di Kometa per `library` al termine della finestra di quiete."""
+        if not self.url:
+            return
+        if self.delegate is not None:
+            task = asyncio.create_task(self._delegate(self.delegate, library))
+            self._delegated.add(task)
+            task.add_done_callback(self._delegated.discard)
+            return
+        pending = self._pending.get(library)
+        if pending is not None:
+            pending.cancel()
+        self._pending[library] = asyncio.create_task(self._run_after_quiet(library))
+        logger.info("🕒 Kometa per '%s' programmato tra %.0fs", library, self.quiet_window)
+
+    async def _delegate(self, delegate, library):
+        try:
+            await asyncio.to_thread(delegate, library)
+        except Exception as e:
+            logger.error("❌ Errore nell'inoltro al leader dell'avvio di Kometa per '%s': %s", library, e)
+
+    async def _run_after_quiet(self, library):
+        await asyncio.sleep(self.quiet_window)
+        if self._pending.get(library) is asyncio.current_task():
+            del self._pending[library]
+        await self._run(library)
+
+    async def _run(self, library):
+        lock = self._locks.setdefault(library, asyncio.Lock())
+        async with lock:
+            await self.start_kometa(library)
+
+    async def start_kometa(self, library):
+        payload = {
+            "libraries": library
+        }
+
+        try:
+            # Kometa risponde a fine esecuzione: solo la lettura ha un timeout lungo
+            timeout = httpx.Timeout(self.http.timeout, read=self.read_timeout)
+            response = await self.http.post(self.url, json=payload, idempotent=False, timeout=timeout)
+        except httpx.HTTPError as e:
+            logger.error("❌ Errore nella chiamata a Kometa: %s", e)
+            return False
+
+        if response.status_code == 200:
+            logger.info("Response kometa: %s", response.json())
+            return True
+        logger.error("Request kometa failed with status code: %s - %s", response.status_code, response.text)
+        return False
+
+    async def stop(self):
+        """Annulla le attese in corso e avvia subito Kometa per le librerie ancora in sospeso."""
+        await asyncio.gather(*self._delegated, return_exceptions=True)
+        pending = list(self._pending)
+        for task in self._pending.values():
+            task.cancel()
+        self._pending = {}
+        await asyncio.gather(*(self._run(library) for library in pending), return_exceptions=True)
@@ -0,0 +1,60 @@
+import asyncio
+import fcntl
+import logging
+import os
+import socket
+
+logger = logging.getLogger(__name__)
+
+LEADER_LOCK_FILE = os.getenv("LEADER_LOCK_FILE", "plexguard.leader.lock")
+
+
+class LeaderLease:
+    """
+    Elezione del leader tra i processi PlexGuard con un lock esclusivo su file (flock).
+
+    Il processo che ottiene il lock lo tiene finché resta attivo e svolge i compiti da
+    eseguire una sola volta (pulizia dei torrent, avvio di Kometa). Se termina, anche per
+    un crash, il sistema operativo rilascia il lock e un altro processo lo ottiene al
+    tentativo successivo. Il file deve stare su un filesystem locale condiviso da tutti
+    i processi (flock non è affidabile su NFS).
+    """
+
+    def __init__(self, path=LEADER_LOCK_FILE, retry_interval=None):
+        self.path = path
+        self.retry_interval = retry_interval or float(os.getenv("LEADER_RETRY_SECONDS", 5))
+        self._file = None
+
+    @property
+    def is_leader(self):
+        return self._file is not None
+
+    def try_acquire(self):
+        """Tenta di ottenere il lock senza attendere; restituisce True se questo processo è leader."""
+        if self._file is not None:
+            return True
+        lock_file = open(self.path, "a+")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        # Solo informativo: chi è il leader attuale
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(f"{socket.gethostname()}:{os.getpid()}\n")
+        lock_file.flush()
+        self._file = lock_file
+        logger.info("👑 Processo %d eletto leader", os.getpid())
+        return True
+
+    async def acquire(self):
+        """Attende di diventare leader, ritentando ogni `retry_interval` secondi."""
+        while not self.try_acquire():
+            await asyncio.sleep(self.retry_interval)
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
@@ -0,0 +1,51 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Le richieste sono salvate nello stesso database SQLite delle tracce audio
+LEADER_REQUESTS_DB = Path(os.getenv("LEADER_REQUESTS_DB", os.getenv("AUDIO_TRACKS_DB", "audio_tracks.db")))
+
+
+class LeaderRequests:
+    """
+    Richieste dei worker al leader (es. "clean", "kometa:<libreria>") su SQLite condiviso.
+
+    Qualsiasi processo può registrare una richiesta; richieste uguali si fondono in una sola
+    riga. Il leader le preleva periodicamente con `take`, che le legge e le cancella nella
+    stessa transazione esclusiva.
+    """
+
+    def __init__(self, path=LEADER_REQUESTS_DB):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(Path(path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leader_requests ("
+                " name TEXT PRIMARY KEY,"
+                " requested_at REAL NOT NULL)"
+            )
+
+    def request(self, name):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO leader_requests (name, requested_at) VALUES (?, ?)",
+                               (name, time.time()))
+
+    def take(self):
+        """Restituisce e rimuove tutte le richieste in attesa, dalla più vecchia."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            names = [row[0] for row in self._conn.execute(
+                "SELECT name FROM leader_requests ORDER BY requested_at")]
+            self._conn.execute("DELETE FROM leader_requests")
+        return names
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,127 @@
+import asyncio
+import functools
+import inspect
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from starlette.responses import Response
+
+from plexguard.RetryLater import RetryLater
+
+logger = logging.getLogger(__name__)
+
+STAGE_DURATION = Histogram(
+    "plexguard_stage_duration_seconds",
+    "Durata delle fasi di elaborazione (Plex, TMDB, Telegram, qBittorrent, ...)",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+STAGE_CALLS = Counter(
+    "plexguard_stage_calls_total",
+    "Chiamate alle fasi di elaborazione per esito",
+    ["stage", "outcome"],
+)
+WEBHOOK_REQUESTS = Counter(
+    "plexguard_webhook_requests_total",
+    "Webhook ricevuti per endpoint e codice di risposta",
+    ["endpoint", "status"],
+)
+# Con più worker i gauge riportano l'ultimo valore scritto da un qualsiasi processo
+QUEUE_DEPTH = Gauge("plexguard_webhook_queue_depth", "Job webhook in attesa di elaborazione",
+                    multiprocess_mode="mostrecent")
+AUDIO_DB_ENTRIES = Gauge("plexguard_audio_db_entries", "Media presenti nel database delle tracce audio",
+                         multiprocess_mode="mostrecent")
+QBITTORRENT_TORRENTS = Gauge("plexguard_qbittorrent_torrents", "Torrent nel mirror locale di qBittorrent per stato",
+                             ["state"], multiprocess_mode="mostrecent")
+
+# Funzioni chiamate a ogni scrape per aggiornare i gauge
+_scrape_hooks = []
+
+
+def timed(stage):
+    """Decoratore che misura durata ed esito di una funzione sincrona o asincrona."""
+
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started_at = time.perf_counter()
+                outcome = "error"
+                try:
+                    result = await func(*args, **kwargs)
+                    outcome = "ok"
+                    return result
+                except RetryLater:
+                    # Job rimandato (es. media non ancora su Plex): non è un errore
+                    outcome = "deferred"
+                    raise
+                finally:
+                    STAGE_DURATION.labels(stage).observe(time.perf_counter() - started_at)
+                    STAGE_CALLS.labels(stage, outcome).inc()
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+            outcome = "error"
+            try:
+                result = func(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                STAGE_DURATION.labels(stage).observe(time.perf_counter() - started_at)
+                STAGE_CALLS.labels(stage, outcome).inc()
+
+        return wrapper
+
+    return decorator
+
+
+def instrument(obj, method_name, stage):
+    """Sostituisce il metodo `method_name` dell'istanza `obj` con la sua versione misurata."""
+    setattr(obj, method_name, timed(stage)(getattr(obj, method_name)))
+
+
+def setup_multiprocess(path=None):
+    """
+    Prepara la raccolta multiprocesso di prometheus_client per più worker uvicorn. Va chiamata
+    nel processo principale prima di avviare i worker: questi ereditano PROMETHEUS_MULTIPROC_DIR
+    e vi scrivono i propri valori, che /metrics somma (contatori e istogrammi) su tutti i processi.
+    I file di un'esecuzione precedente vengono eliminati.
+    """
+    path = Path(path or os.getenv("PROMETHEUS_MULTIPROC_DIR") or Path(tempfile.gettempdir()) / "plexguard-metrics")
+    path.mkdir(parents=True, exist_ok=True)
+    for stale in path.glob("*.db"):
+        stale.unlink()
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(path)
+    logger.info("📊 Metriche raccolte da tutti i worker in %s", path)
+
+
+def add_scrape_hook(hook):
+    """Registra una funzione (sincrona) da chiamare prima di ogni export delle metriche."""
+    _scrape_hooks.append(hook)
+
+
+def _export():
+    for hook in _scrape_hooks:
+        try:
+            hook()
+        except Exception as e:
+            logger.warning("⚠️ Errore nell'aggiornamento delle metriche: %s", e)
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest()
+
+
+async def metrics(request):
+    """Endpoint /metrics in formato Prometheus."""
+    # Gli hook interrogano SQLite e il collector multiprocesso legge file: fuori dall'event loop
+    return Response(await asyncio.to_thread(_export), media_type=CONTENT_TYPE_LATEST)
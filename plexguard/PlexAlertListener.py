@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Stato "elaborazione completata" delle voci timeline di Plex
+TIMELINE_STATE_DONE = 5
+
+
+class PlexAlertListener:
+    """
+    Ascolta lo stream di notifiche di Plex (/:/websockets/notifications) e risveglia
+    gli import in attesa non appena Plex termina la scansione di un elemento.
+
+    Le attese restano valide anche senza listener attivo: `wait` scade semplicemente
+    dopo il timeout richiesto, e il chiamante torna al polling.
+    """
+
+    def __init__(self):
+        self._listener = None
+        self._waiters = set()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._listener is not None and self._listener.is_alive()
+
+    def start(self, plex):
+        if self.running:
+            return
+        try:
+            self._listener = plex.startAlertListener(callback=self._on_alert, callbackError=self._on_error)
+            logger.info("📡 In ascolto delle notifiche Plex")
+        except Exception as e:
+            logger.warning("⚠️ Notifiche Plex non disponibili, si usa solo il polling: %s", e)
+            self._listener = None
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def _on_error(self, error):
+        logger.warning("⚠️ Errore nello stream di notifiche Plex: %s", error)
+
+    def _on_alert(self, data):
+        """Callback del thread websocket: sveglia le attese a fine scansione/analisi."""
+        alert_type = data.get("type")
+        if alert_type == "timeline":
+            done = any(entry.get("state") == TIMELINE_STATE_DONE for entry in data.get("TimelineEntry", []))
+        elif alert_type == "activity":
+            done = any(notification.get("event") == "ended"
+                       for notification in data.get("ActivityNotification", []))
+        else:
+            done = False
+        if done:
+            self.notify()
+
+    def notify(self):
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+    async def wait(self, timeout):
+        """Attende una notifica di Plex per al massimo `timeout` secondi."""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, loop.create_future())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1], timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
@@ -0,0 +1,187 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from plexapi.exceptions import NotFound
+
+logger = logging.getLogger(__name__)
+
+PLEX_GUID_INDEX = Path(os.getenv("PLEX_GUID_INDEX", "plex_guid_index.json"))
+
+# Margine di sicurezza sulle sincronizzazioni incrementali (orologi non allineati Plex/PlexGuard)
+SYNC_MARGIN_SECONDS = 120
+
+INDEXED_SECTION_TYPES = ("movie", "show")
+
+
+class PlexGuidIndex:
+    """
+    Indice persistente GUID → ratingKey della libreria Plex.
+
+    Ogni chiave ha la forma "<provider>://<id>" (es. "tmdb://603", "imdb://tt0133093", "tvdb://81189")
+    e punta a {"ratingKey", "section", "type"}. L'indice viene costruito una sola volta scorrendo
+    le sezioni film/serie e poi aggiornato in modo incrementale con i soli elementi aggiunti o
+    modificati (addedAt/updatedAt) dopo l'ultima sincronizzazione.
+
+    Con più worker solo il leader interroga Plex e riscrive il file: negli altri processi
+    `delegate` chiede la sincronizzazione al leader e l'indice viene ricaricato dal disco
+    quando il file cambia (mtime).
+    """
+
+    def __init__(self, path=PLEX_GUID_INDEX):
+        self.path = Path(path)
+        self.entries = {}
+        self.last_sync = None
+        self._lock = threading.Lock()
+        self._mtime = None
+        self.delegate = None
+
+    def load(self):
+        """Carica l'indice dal disco al primo utilizzo e di nuovo ogni volta che il file cambia."""
+        with self._lock:
+            self._load_if_changed()
+
+    def _load_if_changed(self):
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                content = f.read().strip()
+            if not content:
+                return
+            data = json.loads(content)
+            self.entries = data.get("entries", {})
+            self.last_sync = data.get("last_sync")
+            logger.info("📇 Indice GUID Plex caricato: %d voci", len(self.entries))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error("❌ Errore nel caricamento dell'indice GUID Plex: %s", e)
+            self.entries = {}
+            self.last_sync = None
+
+    def _save(self):
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"last_sync": self.last_sync, "entries": self.entries}, f)
+        os.replace(tmp_path, self.path)
+        self._mtime = self.path.stat().st_mtime_ns
+
+    def _index_item(self, item, section):
+        """Indicizza i GUID dell'elemento; restituisce quante voci sono cambiate."""
+        changed = 0
+        for guid in item.guids:
+            entry = {
+                "ratingKey": item.ratingKey,
+                "section": section.key,
+                "type": section.type,
+            }
+            if self.entries.get(guid.id) != entry:
+                self.entries[guid.id] = entry
+                changed += 1
+        return changed
+
+    def sync(self, plex):
+        """
+        Allinea l'indice a Plex: ricostruzione completa la prima volta, poi solo i delta.
+        Il file viene riscritto solo se il delta ha cambiato delle voci. Se `delegate` è
+        impostato, la sincronizzazione viene chiesta al leader e l'indice solo ricaricato.
+        """
+        delegate = self.delegate
+        if delegate is not None:
+            delegate()
+            self.load()
+            return
+        with self._lock:
+            self._load_if_changed()
+            started_at = time.time()
+            if self.last_sync is None:
+                self._full_build(plex)
+                changed = True
+            else:
+                changed = self._delta_sync(plex)
+            self.last_sync = started_at
+            if changed:
+                self._save()
+
+    def _full_build(self, plex):
+        logger.info("📇 Costruzione completa dell'indice GUID Plex...")
+        self.entries = {}
+        for section in plex.library.sections():
+            if section.type not in INDEXED_SECTION_TYPES:
+                continue
+            for item in section.search():
+                self._index_item(item, section)
+        logger.info("✅ Indice GUID Plex costruito: %d voci", len(self.entries))
+
+    def _delta_sync(self, plex):
+        """Indicizza gli elementi aggiunti o modificati; restituisce il numero di voci cambiate."""
+        since = datetime.datetime.fromtimestamp(self.last_sync - SYNC_MARGIN_SECONDS)
+        updated = 0
+        changed = 0
+        for section in plex.library.sections():
+            if section.type not in INDEXED_SECTION_TYPES:
+                continue
+            seen = set()
+            for field in ("addedAt", "updatedAt"):
+                for item in section.search(filters={f"{field}>>": since}):
+                    if item.ratingKey in seen:
+                        continue
+                    seen.add(item.ratingKey)
+                    changed += self._index_item(item, section)
+            updated += len(seen)
+        if changed:
+            logger.info("📇 Indice GUID Plex aggiornato: %d elementi modificati, %d voci cambiate", updated, changed)
+        return changed
+
+    def _drop(self, rating_key):
+        with self._lock:
+            stale = [guid for guid, entry in self.entries.items() if entry["ratingKey"] == rating_key]
+            for guid in stale:
+                del self.entries[guid]
+            # Solo il leader riscrive il file
+            if stale and self.delegate is None:
+                self._save()
+
+    def _lookup(self, guids, libtype):
+        for guid in guids:
+            entry = self.entries.get(guid)
+            if entry is not None and entry["type"] == libtype:
+                return entry
+        return None
+
+    def find(self, plex, ids, libtype):
+        """
+        Restituisce l'elemento Plex di tipo `libtype` che corrisponde a uno degli id esterni
+        `ids` (dizionario provider → id, es. {"tmdb": 603, "imdb": "tt0133093"}), oppure None.
+        In caso di miss viene fatta una sincronizzazione incrementale prima di arrendersi.
+        """
+        guids = [f"{provider}://{value}" for provider, value in ids.items() if value]
+        if not guids:
+            return None
+
+        self.load()
+        entry = self._lookup(guids, libtype)
+        if entry is None:
+            self.sync(plex)
+            entry = self._lookup(guids, libtype)
+            if entry is None:
+                return None
+
+        try:
+            return plex.fetchItem(entry["ratingKey"])
+        except NotFound:
+            logger.warning("⚠️ ratingKey %s non più presente su Plex, rimosso dall'indice", entry["ratingKey"])
+            self._drop(entry["ratingKey"])
+            return None
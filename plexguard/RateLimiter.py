@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Lo stato dei limiti è salvato nello stesso database SQLite delle tracce audio
+RATE_LIMIT_DB = Path(os.getenv("RATE_LIMIT_DB", os.getenv("AUDIO_TRACKS_DB", "audio_tracks.db")))
+
+
+class TokenBucket:
+    """
+    Rate limiter asincrono a token bucket, condiviso tra tutte le richieste e tutti i processi.
+
+    Concede in media `rate` operazioni al secondo con raffiche fino a `capacity`. Lo stato
+    (token, ultimo aggiornamento, pausa) è una riga SQLite per `name` aggiornata in una
+    transazione esclusiva, quindi con più worker il limite resta complessivo.
+    `pause` blocca tutti i chiamanti di tutti i processi per il tempo indicato dal server
+    (es. `retry_after`).
+    """
+
+    def __init__(self, name, rate, capacity=1, path=RATE_LIMIT_DB):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self._lock = asyncio.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(Path(path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                " name TEXT PRIMARY KEY,"
+                " tokens REAL NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " paused_until REAL NOT NULL DEFAULT 0)"
+            )
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                wait = await asyncio.to_thread(self._take)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    def _take(self):
+        """Prende un token se disponibile; altrimenti restituisce i secondi da attendere."""
+        now = time.time()
+        with self._db_lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT tokens, updated_at, paused_until FROM rate_limits WHERE name = ?",
+                                     (self.name,)).fetchone()
+            tokens, updated_at, paused_until = row if row else (self.capacity, now, 0.0)
+            if now < paused_until:
+                return paused_until - now
+            tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            if tokens >= 1:
+                tokens -= 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (name, tokens, updated_at, paused_until) VALUES (?, ?, ?, ?)",
+                (self.name, tokens, now, paused_until))
+        return wait
+
+    async def pause(self, seconds):
+        await asyncio.to_thread(self._pause, seconds)
+
+    def _pause(self, seconds):
+        now = time.time()
+        with self._db_lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO rate_limits (name, tokens, updated_at, paused_until) VALUES (?, 0, ?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET tokens = 0, updated_at = excluded.updated_at,"
+                " paused_until = MAX(paused_until, excluded.paused_until)",
+                (self.name, now, now + seconds))
+
+    def close(self):
+        with self._db_lock:
+            self._conn.close()
@@ -0,0 +1,9 @@
+class RetryLater(Exception):
+    """
+    Il job non può ancora essere completato (es. Plex non ha indicizzato il media): va
+    rimesso in coda e ripreso dopo `delay` secondi, senza contarlo come tentativo fallito.
+    """
+
+    def __init__(self, delay, message=""):
+        super().__init__(message)
+        self.delay = delay
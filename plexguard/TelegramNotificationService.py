@@ -1,20 +1,44 @@
 import asyncio
-import io
-import json
+import datetime
+import functools
+import html
 import logging
+import ntpath
 import os
 import re
-from pathlib import Path
+import threading
+import time
 
-import requests
+import httpx
+from plexapi.exceptions import NotFound
 from plexapi.server import PlexServer
-from telegram import Bot
+from telegram import Bot, InputMediaPhoto
+from telegram.error import RetryAfter
+
+from plexguard.AudioTrackStore import AudioTrackStore
+from plexguard.HttpClient import HttpClient
+from plexguard.ImageCache import DiskImageCache
+from plexguard.KometaTrigger import KometaTrigger
+from plexguard.PlexAlertListener import PlexAlertListener
+from plexguard.PlexGuidIndex import SYNC_MARGIN_SECONDS, PlexGuidIndex
+from plexguard.RateLimiter import TokenBucket
+from plexguard.RetryLater import RetryLater
+from plexguard.TTLCache import TTLCache
 
 # Configura il logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-AUDIO_TRACKS_DB = Path("audio_tracks.json")
+TMDB_API_URL = os.getenv("TMDB_API_URL", "https://api.themoviedb.org/3")
+TMDB_IMAGE_URL = os.getenv("TMDB_IMAGE_URL", "https://image.tmdb.org/t/p")
+
+# Limiti dell'API Telegram
+TELEGRAM_CAPTION_LIMIT = 1024
+TELEGRAM_MESSAGE_LIMIT = 4096
+TELEGRAM_ALBUM_SIZE = 10
+
+# Chiave aggiunta al payload di /imported con l'istante della richiesta di scansione a Plex
+SCAN_REQUESTED_AT = "_scan_requested_at"
 
 # Mappatura delle lingue alle emoji delle bandiere
 flag_mapping = {
@@ -49,68 +73,25 @@ flag_mapping = {
 }
 
 
-def get_episode_unique_imdb_id(data):
+def save_languages_on_db(audio_store, entries):
     """
-    Crea un identificatore univoco per un episodio combinando l'IMDb ID, il numero di stagione e di episodio.
-    Se uno di questi campi manca, restituisce solo l'IMDb ID come fallback.
+    Salva in un'unica transazione le lingue di una lista di (title, media, languages, id).
+    Restituisce, per ogni elemento, (title, languages) se salvato oppure None.
     """
-    imdb_id = data.get("series", {}).get("tmdbId")
-    season_number = data.get("episode", {}).get("seasonNumber")
-    episode_number = data.get("episode", {}).get("episodeNumber")
-
-    if imdb_id and season_number is not None and episode_number is not None:
-        # Formatta la stagione e l'episodio con due cifre (es. S01E01)
-        return f"{imdb_id}-S{int(season_number):02d}E{int(episode_number):02d}"
-    return imdb_id  # fallback se non tutti i dati sono disponibili
-
-
-def _load_audio_db():
-    try:
-        with open(AUDIO_TRACKS_DB, "r", encoding="utf-8") as f:
-            content = f.read().strip()
-            if not content:
-                return {}  # Se il file è vuoto, ritorna un dizionario vuoto
-            return json.loads(content)
-    except Exception as e:
-        logger.error("❌ Errore nel caricamento del database audio: %s", e)
-        return {}
-
-
-def _save_audio_db(data):
-    with open(AUDIO_TRACKS_DB, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-
-def save_languages_on_db(title, media, languages, id):
-    if not media or not languages:
-        return None
-
-    audio_db = _load_audio_db()
-    audio_db[id] = languages
-    _save_audio_db(audio_db)
-
-    logger.info("🎧 Tracce audio salvate per %s: %s", title, languages)
-    return title, languages
-
-
-def start_kometa(libraries):
-    # Define the URL of the endpoint
-    url = "http://192.168.1.10:5009/kometa"
-
-    # Define the payload with the "libraries" parameter
-    payload = {
-        "libraries": libraries
-    }
-
-    # Make a POST request to the endpoint with a JSON payload
-    response = requests.post(url, json=payload)
-
-    # Check the status code and print the result
-    if response.status_code == 200:
-        print("Response kometa:", response.json())
-    else:
-        print("Request kometa failed with status code:", response.status_code)
-        print("Error kometa response:", response)
+    to_save = {}
+    results = []
+    for title, media, languages, media_id in entries:
+        if not media or not languages:
+            results.append(None)
+            continue
+        to_save[media_id] = languages
+        results.append((title, languages))
+
+    audio_store.upsert_many(to_save)
+    for result in results:
+        if result:
+            logger.info("🎧 Tracce audio salvate per %s: %s", *result)
+    return results
 
 
 class TelegramNotificationService:
@@ -120,9 +101,37 @@ class TelegramNotificationService:
         self.plex_token = os.getenv("PLEX_TOKEN")
         self.telegram_bot_token = os.getenv("TELEGRAM_BOT_TOKEN")
         self.telegram_chat_id = os.getenv("TELEGRAM_CHAT_ID")
+        # Riepilogo degli import con più episodi: "message", "album" oppure "off"
+        self.telegram_digest = os.getenv("TELEGRAM_DIGEST", "message").lower()
+        self.telegram_max_retries = int(os.getenv("TELEGRAM_MAX_RETRIES", 5))
+        # Limite complessivo di tutti i worker: lo stato del bucket è condiviso su SQLite
+        self.telegram_limiter = TokenBucket("telegram", rate=float(os.getenv("TELEGRAM_RATE_PER_SECOND", 1)),
+                                            capacity=int(os.getenv("TELEGRAM_BURST", 3)))
         self.tmdb_api_key = os.getenv("TMDB_API_KEY")
+        # Attesa adattiva dopo un import: backoff esponenziale fino alla scadenza
+        self.import_wait_timeout = float(os.getenv("IMPORT_WAIT_TIMEOUT", 300))
+        self.import_wait_initial_delay = float(os.getenv("IMPORT_WAIT_INITIAL_DELAY", 2))
+        self.import_wait_max_delay = float(os.getenv("IMPORT_WAIT_MAX_DELAY", 30))
+        self.plex_alerts_enabled = os.getenv("PLEX_ALERTS", "true").lower() == "true"
+        self.plex_healthcheck_interval = float(os.getenv("PLEX_HEALTHCHECK_INTERVAL", 60))
         self.plex = None
+        self._plex_lock = threading.Lock()
+        self._plex_checked_at = 0.0
+        self.stream_refresh_cooldown = float(os.getenv("STREAM_REFRESH_COOLDOWN", 300))
+        # Secondi dopo la richiesta di scansione oltre i quali un media ancora col vecchio file viene aggiornato
+        self.stale_refresh_after = float(os.getenv("STREAM_STALE_REFRESH_AFTER", 30))
+        self._stream_refreshed_at = {}
         self.bot = None
+        self.guid_index = PlexGuidIndex()
+        self.audio_store = AudioTrackStore()
+        self.alert_listener = PlexAlertListener()
+        self.http = HttpClient()
+        self.kometa = KometaTrigger(self.http)
+        # Dimensione delle immagini TMDB (es. "w780" invece di "original" per ridurre banda e upload)
+        self.tmdb_image_size = os.getenv("TMDB_IMAGE_SIZE", "original")
+        self.image_url_cache = TTLCache(maxsize=int(os.getenv("TMDB_CACHE_SIZE", 1024)),
+                                        ttl=float(os.getenv("TMDB_CACHE_TTL", 86400)))
+        self.image_cache = DiskImageCache(max_bytes=int(os.getenv("IMAGE_CACHE_MAX_MB", 200)) * 1024 * 1024)
 
         # Verifica i parametri e inizializza i servizi
         self._initialize_telegram()
@@ -136,11 +145,66 @@ class TelegramNotificationService:
         try:
             self.plex = PlexServer(self.plex_url, self.plex_token)
             logger.info("✅ Connessione a Plex avvenuta con successo!")
-            self.plex.library.update()
+            if self.plex_alerts_enabled:
+                self.alert_listener.start(self.plex)
         except Exception as e:
             logger.error("❌ Errore nella connessione a Plex: %s", e)
             self.plex = None
 
+    def _get_plex(self):
+        """
+        Restituisce l'unica connessione Plex del processo, creandola al primo utilizzo.
+        Al massimo ogni `plex_healthcheck_interval` secondi verifica che risponda e, se non
+        risponde, la ricrea.
+        """
+        with self._plex_lock:
+            now = time.monotonic()
+            if self.plex is not None and now - self._plex_checked_at < self.plex_healthcheck_interval:
+                return self.plex
+
+            if self.plex is not None:
+                try:
+                    self.plex.query("/identity")
+                    self._plex_checked_at = now
+                    return self.plex
+                except Exception as e:
+                    logger.warning("⚠️ Connessione Plex non più valida, riconnessione: %s", e)
+                    self.plex = None
+
+            self._initialize_plex()
+            self._plex_checked_at = now
+            return self.plex
+
+    def _refresh_library(self, data):
+        """
+        Chiede a Plex di scansionare solo la cartella del media del webhook
+        (`series.path` o `movie.folderPath`) nella sezione che la contiene.
+        """
+        if data.get('series'):
+            path, libtype = data['series'].get('path'), 'show'
+        elif data.get('movie'):
+            path, libtype = data['movie'].get('folderPath'), 'movie'
+        else:
+            return
+
+        try:
+            sections = [section for section in self.plex.library.sections() if section.type == libtype]
+            if path:
+                for section in sections:
+                    if any(path == location or path.startswith(location.rstrip("/") + "/")
+                           for location in section.locations):
+                        section.update(path=path)
+                        logger.info("🔄 Scansione Plex di '%s' nella sezione '%s'", path, section.title)
+                        return
+
+            # Percorso assente o non mappato su Plex: scansione delle sole sezioni del tipo giusto
+            logger.info("🔄 Percorso '%s' non trovato nelle sezioni Plex, scansione delle sezioni '%s'",
+                        path, libtype)
+            for section in sections:
+                section.update()
+        except Exception as e:
+            logger.error("❌ Errore nell'aggiornamento della libreria Plex: %s", e)
+
     def _initialize_telegram(self):
         """ Inizializza il bot Telegram, se possibile """
         if not self.telegram_bot_token or not self.telegram_chat_id:
@@ -148,7 +212,8 @@ class TelegramNotificationService:
             return
 
         try:
-            self.bot = Bot(token=self.telegram_bot_token)
+            self.bot = Bot(token=self.telegram_bot_token,
+                           base_url=os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot"))
             logger.info("✅ Bot Telegram inizializzato correttamente!")
         except Exception as e:
             logger.error("❌ Errore nell'inizializzazione del bot Telegram: %s", e)
@@ -164,53 +229,119 @@ class TelegramNotificationService:
                     "seasonNumber": data.get('series', {}).get('seasonNumber')
                 }
                 data['episodes'].append(episode_info)
-        self._initialize_plex()
-
-    def _find_media_by_id(self, data):
+        if self._get_plex():
+            self._refresh_library(data)
+
+    def _find_movie(self, data):
+        movie = data.get('movie')
+        tmdb_id = movie.get('tmdbId')
+        logger.info("🔍 Ricerca Plex per tmdbId: %s", tmdb_id)
+        item = self.guid_index.find(self.plex, {"tmdb": tmdb_id, "imdb": movie.get('imdbId')}, "movie")
+        if not item:
+            return [(None, None, tmdb_id, 'movie')]
+
+        logger.info("✅ Trovato '%s' con tmdbId %s nella sezione '%s'",
+                    item.title, tmdb_id, item.librarySectionTitle)
+        return [(item.title, item, tmdb_id, 'movie')]
+
+    def _find_episodes(self, data):
+        """
+        Risolve in blocco tutti gli episodi del payload: una sola ricerca della serie e
+        una sola lettura per ogni stagione coinvolta, con accesso agli episodi per dizionario.
+        """
+        series = data.get('series')
+        tmdb_id = series.get('tmdbId')
+        requested = [(int(episode.get('seasonNumber')), int(episode.get('episodeNumber')))
+                     for episode in data.get('episodes') or []]
+        if not requested:
+            return []
+
+        logger.info("🔍 Ricerca Plex per tmdbId: %s", tmdb_id)
+        item = self.guid_index.find(self.plex, {"tmdb": tmdb_id, "tvdb": series.get('tvdbId'),
+                                                "imdb": series.get('imdbId')}, "show")
+        if not item:
+            return [(None, None, f"{tmdb_id}-s{season:02d}e{episode:02d}", 'series')
+                    for season, episode in requested]
+
+        logger.info("🔍 Ricerca di %d episodi di '%s' con tmdbId %s nella sezione '%s'",
+                    len(requested), item.title, tmdb_id, item.librarySectionTitle)
+
+        episodes_by_code = {}
+        for season_number in sorted({season for season, _ in requested}):
+            try:
+                season = item.season(season=season_number)
+            except NotFound:
+                logger.warning("⚠️ Stagione %d di '%s' non trovata su Plex", season_number, item.title)
+                continue
+            for episode in season.episodes():
+                episodes_by_code[episode.seasonEpisode] = episode
+
+        results = []
+        for season_number, episode_number in requested:
+            season_episode = f"s{season_number:02d}e{episode_number:02d}"
+            target_id = f"{tmdb_id}-{season_episode}"
+            target_episode = episodes_by_code.get(season_episode)
+            if target_episode is None:
+                results.append((None, None, target_id, 'series'))
+                continue
+
+            logger.info("✅ Episodio trovato con episode_tmdbId ID %s", target_id)
+            results.append((f"{item.title} - {target_episode.title} - {str.upper(season_episode)}",
+                            target_episode, target_id, 'series'))
+        return results
+
+    def resolve_media(self, data):
+        """
+        Restituisce una lista di (title, media, id, media_type): un elemento per il film
+        oppure uno per ogni episodio richiesto (media None se non trovato su Plex).
+        """
+        if not self.plex:
+            return []
         if data.get('movie'):
-            tmdb_id = data.get('movie').get('tmdbId')
-            logger.info("🔍 Ricerca Plex per tmdbId: %s", tmdb_id)
-            for section in self.plex.library.sections():
-                if section.type == 'movie':
-                    results = section.search(title="")
-                    for item in results:
-                        if any(f"tmdb://{tmdb_id}" == g.id for g in item.guids):
-                            logger.info("✅ Trovato '%s' con tmdbId %s nella sezione '%s'",
-                                        item.title, tmdb_id, section.title)
-                            item.refresh()
-                            item.reload()
-                            return item.title, item, tmdb_id, 'movie'
-
+            return self._find_movie(data)
         if data.get('series'):
-            tmdb_id = data.get('series').get('tmdbId')
-            logger.info("🔍 Ricerca Plex per tmdbId: %s", tmdb_id)
-            for section in self.plex.library.sections():
-                if section.type == 'show':
-                    results = section.search(title="")
-                    for item in results:
-                        if any(f"tmdb://{tmdb_id}" == g.id for g in item.guids):
-                            logger.info("🔍 Ricerca episodio '%s' con tmdbId %s nella sezione '%s'",
-                                        item.title, tmdb_id, section.title)
-                            item.refresh()
-                            item.reload()
-                            if item.episodes():
-                                payload_episode_id = f"{tmdb_id}-s{int(data.get('seasonNumber')):02d}e{int(data.get('episodeNumber')):02d}"
-                                episodes = item.episodes()
-                                for target_episode in episodes:
-                                    target_id = f"{tmdb_id}-{target_episode.seasonEpisode}"
-                                    if target_id == payload_episode_id:
-                                        logger.info("✅ Episodio trovato con episode_tmdbId ID %s", target_id)
-                                        # Forza l'aggiornamento dei metadati per assicurarsi che siano completi
-                                        target_episode.refresh()
-                                        target_episode.reload()
-                                        return f"{item.title} - {target_episode.title} - {str.upper(target_episode.seasonEpisode)}", target_episode, target_id, 'series'
-
-        return None, None, None, None
-
-    async def send_telegram_notification(self, title, current_languages, summary, media_id, media_type):
+            return self._find_episodes(data)
+        return []
+
+    async def _send_with_retry(self, method, **kwargs):
+        """
+        Chiama un metodo del bot rispettando il rate limit condiviso tra tutti i worker. Se Telegram
+        risponde 429, tutte le richieste di tutti i processi vengono sospese per `retry_after`
+        secondi e l'invio viene ripetuto.
+        """
+        attempt = 0
+        while True:
+            await self.telegram_limiter.acquire()
+            try:
+                return await method(**kwargs)
+            except RetryAfter as e:
+                if attempt >= self.telegram_max_retries:
+                    raise
+                retry_after = e.retry_after
+                if isinstance(retry_after, datetime.timedelta):
+                    retry_after = retry_after.total_seconds()
+                logger.warning("⏳ Limite Telegram raggiunto, nuovo invio tra %ss", retry_after)
+                await self.telegram_limiter.pause(float(retry_after))
+                attempt += 1
+
+    async def _get_image(self, media_id, media_type, image_url_task=None):
+        """Restituisce i byte dell'immagine TMDB del media, oppure None."""
+        if image_url_task is None:
+            image_url = await self.get_tmdb_image_url(media_id, media_type)
+        else:
+            image_url = await image_url_task
+
+        if image_url is None:
+            logger.error("❌ Errore nel download dell'immagine")
+            return None
+        return await self.download_image(image_url)
+
+    async def send_telegram_notification(self, title, current_languages, summary, media_id, media_type,
+                                         image_url_task=None):
         """Invia una notifica su Telegram con messaggio e immagine.
 
-        L'URL dell'immagine viene scaricato e inviato come file.
+        L'URL dell'immagine viene scaricato e inviato come file. Se la ricerca dell'immagine
+        su TMDB è già stata avviata, `image_url_task` è il relativo task da attendere.
         Questa funzione è interamente asincrona e deve essere chiamata con `await`.
         """
         if not self.bot:
@@ -218,20 +349,7 @@ class TelegramNotificationService:
             return False
 
         try:
-            if media_type == "movie":
-                image_url = self.get_tmdb_italian_movie_poster(media_id)
-            else:
-                image_url = self.get_tmdb_episode_still(media_id)
-
-            # Scarica l'immagine dall'URL in modo sincrono
-            # (Se vuoi farlo asincrono puoi usare aiohttp, ma qui restiamo semplici)
-            image_bytes = None
-            if image_url is None:
-                logger.error("❌ Errore nel download dell'immagine")
-            else:
-                # Converte il contenuto in un file-like object
-                response = requests.get(image_url)
-                image_bytes = io.BytesIO(response.content)
+            image_bytes = await self._get_image(media_id, media_type, image_url_task)
 
             # Sostituisci ogni lingua con la sua emoji (se disponibile)
             flags = [flag_mapping.get(lang, lang) for lang in current_languages]
@@ -245,14 +363,16 @@ class TelegramNotificationService:
                 message += f'\n\n<a href="https://www.youtube.com/results?search_query={title} trailer">Trailer</a>'
 
             if image_bytes is None:
-                await self.bot.send_message(
+                await self._send_with_retry(
+                    self.bot.send_message,
                     chat_id=self.telegram_chat_id,
                     text=message,
                     parse_mode="HTML"
                 )
             else:
                 # Invia la foto con la didascalia
-                await self.bot.send_photo(
+                await self._send_with_retry(
+                    self.bot.send_photo,
                     chat_id=self.telegram_chat_id,
                     photo=image_bytes,
                     caption=message,
@@ -264,122 +384,420 @@ class TelegramNotificationService:
             logger.error("❌ Errore nell'invio della notifica Telegram: %s", e)
             return False
 
-    def get_languages(self, data):
+    async def send_telegram_digest(self, entries):
+        """
+        Invia un unico riepilogo per gli episodi di uno stesso import.
+
+        Con TELEGRAM_DIGEST=message viene inviato un solo messaggio (foto del primo episodio
+        con l'elenco in didascalia); con TELEGRAM_DIGEST=album gli episodi con immagine vengono
+        raggruppati in album da 10 foto e gli altri elencati in un messaggio di testo. Le
+        immagini vengono cercate su TMDB solo quando servono: tutte per l'album, per il
+        messaggio singolo una alla volta fino alla prima disponibile.
+        """
+        if not self.bot:
+            logger.warning("⚠️ Nessuna connessione Telegram disponibile. Notifica non inviata.")
+            return False
+
+        try:
+            lines = [digest_line(media, languages) for title, media, languages, media_id, media_type in entries]
+            header = f"<b>{html.escape(entries[0][1].grandparentTitle)}</b>\n<b>{len(entries)} nuovi episodi</b>"
+
+            if self.telegram_digest == "album":
+                images = await asyncio.gather(*(self._get_image(media_id, media_type)
+                                                for title, media, languages, media_id, media_type in entries))
+                album = [InputMediaPhoto(media=image, caption=line, parse_mode="HTML")
+                         for image, line in zip(images, lines) if image is not None]
+                without_image = [line for image, line in zip(images, lines) if image is None]
+                for start in range(0, len(album), TELEGRAM_ALBUM_SIZE):
+                    chunk = album[start:start + TELEGRAM_ALBUM_SIZE]
+                    if len(chunk) == 1:
+                        await self._send_with_retry(self.bot.send_photo, chat_id=self.telegram_chat_id,
+                                                    photo=chunk[0].media, caption=chunk[0].caption,
+                                                    parse_mode="HTML")
+                    else:
+                        await self._send_with_retry(self.bot.send_media_group, chat_id=self.telegram_chat_id,
+                                                    media=chunk)
+                if without_image:
+                    await self._send_with_retry(self.bot.send_message, chat_id=self.telegram_chat_id,
+                                                text=fit_lines(header, without_image, TELEGRAM_MESSAGE_LIMIT),
+                                                parse_mode="HTML")
+            else:
+                # Serve una sola foto: si scarica la prima disponibile, senza scaricare le altre
+                image = None
+                for title, media, languages, media_id, media_type in entries:
+                    image = await self._get_image(media_id, media_type)
+                    if image is not None:
+                        break
+                if image is None:
+                    await self._send_with_retry(self.bot.send_message, chat_id=self.telegram_chat_id,
+                                                text=fit_lines(header, lines, TELEGRAM_MESSAGE_LIMIT),
+                                                parse_mode="HTML")
+                else:
+                    await self._send_with_retry(self.bot.send_photo, chat_id=self.telegram_chat_id, photo=image,
+                                                caption=fit_lines(header, lines, TELEGRAM_CAPTION_LIMIT),
+                                                parse_mode="HTML")
+            logger.info("📨 Riepilogo di %d episodi inviato su Telegram con successo!", len(entries))
+            return True
+        except Exception as e:
+            logger.error("❌ Errore nell'invio del riepilogo Telegram: %s", e)
+            return False
+
+    def get_languages_batch(self, data, is_stale=None, refresh_stale=False):
         """
-        Restituisce una tupla (media, languages, id) dove:
+        Restituisce una lista di tuple (title, media, languages, id, media_type), una per il
+        film o per ciascun episodio del payload, dove:
           - media: l'oggetto media (film o episodio)
           - languages: lista deduplicata delle lingue audio
           - id: identificatore univoco per l'elemento
+        `is_stale`, se indicato, riconosce i media che mostrano ancora il vecchio file: i loro
+        stream non vengono letti (languages vuota) e, con `refresh_stale`, viene chiesto a
+        Plex di aggiornarli.
         """
-        title, media, media_id, media_type = self._find_media_by_id(data)
-        if not media:
-            return None, None, None, None, None
+        resolved = self.resolve_media(data)
+        stale = {media.ratingKey for title, media, media_id, media_type in resolved
+                 if media and is_stale and is_stale(media)}
+        languages_by_key = self._stream_languages([media for title, media, media_id, media_type in resolved
+                                                   if media and media.ratingKey not in stale])
+        results = []
+        for title, media, media_id, media_type in resolved:
+            languages = None
+            if media:
+                languages = languages_by_key.get(media.ratingKey, [])
+                if media.ratingKey in stale:
+                    if refresh_stale:
+                        self._refresh_streams(media, stale=True)
+                elif not languages:
+                    self._refresh_streams(media)
+            results.append((title, media, languages, str(media_id) if media_id else None, media_type))
+        return results
+
+    def _audio_languages(self, media, refresh=True):
+        """Lingue audio deduplicate del media; se mancano e `refresh` è vero, chiede un refresh a Plex."""
+        languages = self._stream_languages([media]).get(media.ratingKey, [])
+        if not languages and refresh:
+            self._refresh_streams(media)
+        return languages
+
+    def _stream_languages(self, items):
+        """
+        Lingue audio deduplicate di tutte le versioni e parti di ogni media, per ratingKey.
+
+        Usa le tracce già presenti sull'oggetto (film letti per ratingKey). Gli elementi che
+        non ne hanno (episodi letti dall'elenco della stagione) vengono riletti insieme, una
+        richiesta /library/metadata/<k1,k2,...> per stagione, senza il refresh dei metadati.
+        """
+        languages_by_key = {}
+        missing = {}
+        for media in items:
+            languages = _audio_stream_languages(media)
+            if languages:
+                languages_by_key[media.ratingKey] = languages
+            else:
+                missing.setdefault(getattr(media, "parentRatingKey", None), []).append(media.ratingKey)
 
-        languages = [track.language for track in media.media[0].parts[0].streams if track.streamType == 2]
-        languages = list(dict.fromkeys(languages))
-        return title, media, languages, str(media_id), media_type
+        for keys in missing.values():
+            for media in self.plex.fetchItems([int(key) for key in keys]):
+                languages_by_key[media.ratingKey] = _audio_stream_languages(media)
+        return languages_by_key
 
-    def save_languages(self, data):
-        title, media, languages, media_id, media_type = self.get_languages(data)
-        return save_languages_on_db(title, media, languages, media_id)
+    def _refresh_streams(self, media, stale=False):
+        """
+        Chiede a Plex il refresh del media, perché le tracce audio mancano del tutto o sono
+        `stale` (relative a un file sostituito dall'import), al massimo una volta ogni
+        `stream_refresh_cooldown` secondi per elemento.
+        """
+        now = time.monotonic()
+        if now - self._stream_refreshed_at.get(media.ratingKey, 0) <= self.stream_refresh_cooldown:
+            return
+        if stale:
+            logger.info("🔄 Tracce audio di '%s' relative al vecchio file, richiesto refresh a Plex", media.title)
+        else:
+            logger.info("🔄 Nessuna traccia audio per '%s', richiesto refresh a Plex", media.title)
+        self._stream_refreshed_at[media.ratingKey] = now
+        media.refresh()
 
     def process_downloading(self, data):
         """Riceve i dati da Sonarr/Radarr al momento del download"""
         self.normalize_data(data)
-        save_languages_result = []
-
-        if data.get('episodes'):
-            episodes = data['episodes']
-            for episode in episodes:
-                data['episodeNumber'] = episode.get('episodeNumber')
-                data['seasonNumber'] = episode.get('seasonNumber')
-
-                save_languages_result.append(self.save_languages(data))
-        else:
-            save_languages_result.append(self.save_languages(data))
-
-        return save_languages_result
+        entries = [(title, media, languages, media_id)
+                   for title, media, languages, media_id, media_type in self.get_languages_batch(data)]
+        return save_languages_on_db(self.audio_store, entries)
 
     async def process_imported(self, data):
-        """Controlla se è stata aggiunta la lingua italiana"""
-        self.normalize_data(data)
-        if not data.get("type"):
-            logger.info("Sleep 70s")
-            await asyncio.sleep(70)
-
-        send_telegram_result_list = []
-        if data.get('episodes'):
-            episodes = data['episodes']
-            for episode in episodes:
-                data['episodeNumber'] = episode.get('episodeNumber')
-                data['seasonNumber'] = episode.get('seasonNumber')
-
-                send_telegram_result_list.append(await self.send_telegram(data))
-                await asyncio.sleep(1)
+        """
+        Controlla se è stata aggiunta la lingua italiana.
+
+        La scansione di Plex viene chiesta una sola volta: l'istante della richiesta resta nel
+        payload, così quando il job viene ripreso dopo `RetryLater` si torna solo a verificare.
+        """
+        if SCAN_REQUESTED_AT not in data:
+            scan_requested_at = time.time()
+            await asyncio.to_thread(self.normalize_data, data)
+            data[SCAN_REQUESTED_AT] = scan_requested_at
+        results = await self.wait_for_media(data)
+        send_telegram_result_list, to_notify = await self.check_languages(results)
+
+        if len(to_notify) > 1 and self.telegram_digest != "off":
+            await self.send_telegram_digest(to_notify)
         else:
-            send_telegram_result_list.append(await self.send_telegram(data))
+            # Le immagini servono solo per i media da notificare: le ricerche su TMDB partono
+            # insieme e vengono attese una alla volta, a ogni invio
+            image_url_tasks = {media_id: asyncio.create_task(self.get_tmdb_image_url(media_id, media_type))
+                               for title, media, languages, media_id, media_type in to_notify}
+            try:
+                for title, media, current_languages, media_id, media_type in to_notify:
+                    await self.send_telegram_notification(title, current_languages, media.summary, media_id,
+                                                          media_type, image_url_tasks[media_id])
+            finally:
+                for task in image_url_tasks.values():
+                    task.cancel()
+        if to_notify:
+            await asyncio.to_thread(save_languages_on_db, self.audio_store,
+                                    [(title, media, languages, media_id)
+                                     for title, media, languages, media_id, media_type in to_notify])
 
         for send_telegram_result in send_telegram_result_list:
-            if "Notifica" in send_telegram_result:
+            if send_telegram_result and "Notifica" in send_telegram_result:
                 # call kometa
                 libraries = 'Serie TV' if data.get('series') else ('Film' if data.get('movie') else None)
                 if libraries:
-                    start_kometa(libraries)
+                    self.kometa.trigger(libraries)
                 break
 
         return send_telegram_result_list
 
-    async def send_telegram(self, data):
-        title, media, current_languages, media_id, media_type = self.get_languages(data)
-        if not media:
-            logger.warning("⚠️ Media non trovato dopo import con id: %s", media_id)
-            return
-        if not current_languages:
-            logger.warning("⚠️ Current Languages non trovato dopo import con id: %s", media_id)
-            return
+    async def wait_for_media(self, data):
+        """
+        Verifica che Plex abbia indicizzato i media importati e le loro tracce audio.
+
+        Un media è pronto quando ha tracce audio e Plex mostra il file appena importato: una
+        parte con nome e dimensione dei file del webhook (`imported_files`) oppure, per un
+        upgrade senza file nel payload, un aggiornamento successivo alla richiesta di scansione.
+        Così un upgrade non viene letto con le tracce del vecchio file; se dopo
+        `stale_refresh_after` secondi Plex mostra ancora il vecchio file, viene chiesto un refresh.
+        Se i media non sono pronti solleva `RetryLater`: il job libera il worker e torna in
+        coda con backoff esponenziale fino a `import_wait_timeout` secondi dalla richiesta di
+        scansione; una notifica di fine scansione da Plex anticipa il controllo successivo.
+        """
+        scan_requested_at = data.get(SCAN_REQUESTED_AT) or time.time()
+        files = imported_files(data)
+        updated_since = None
+        if data.get('isUpgrade') and not files:
+            updated_since = scan_requested_at - SYNC_MARGIN_SECONDS
+
+        check_stale = functools.partial(is_stale, files=files, updated_since=updated_since)
+
+        elapsed = time.time() - scan_requested_at
+        results = await asyncio.to_thread(self.get_languages_batch, data, check_stale,
+                                          elapsed >= self.stale_refresh_after)
+        pending = [media_id for title, media, languages, media_id, media_type in results
+                   if not (media and languages)]
+        if not pending:
+            return results
+
+        remaining = self.import_wait_timeout - elapsed
+        if remaining <= 0:
+            logger.warning("⏰ Media non pronto su Plex dopo %.0fs: %s", elapsed, ", ".join(pending))
+            # Si confrontano comunque le tracce che Plex mostra ora
+            return await asyncio.to_thread(self.get_languages_batch, data)
+        # Si attende quanto già atteso: a ogni controllo l'intervallo raddoppia
+        delay = min(max(elapsed, self.import_wait_initial_delay), self.import_wait_max_delay, remaining)
+        logger.info("⏳ Media non ancora pronto su Plex dopo %.0fs, nuovo controllo entro %.0fs", elapsed, delay)
+        raise RetryLater(delay, f"Media non ancora pronto su Plex: {', '.join(pending)}")
+
+    async def check_languages(self, results):
+        """
+        Confronta le lingue attuali con quelle salvate e decide cosa notificare.
+        Restituisce l'esito per ogni elemento e la lista degli elementi da notificare.
+        """
+        ready_ids = [media_id for title, media, languages, media_id, media_type in results if media and languages]
+        previous_by_id = await asyncio.to_thread(self.audio_store.get_many, ready_ids)
+
+        outcomes = []
+        to_notify = []
+        for result in results:
+            title, media, current_languages, media_id, media_type = result
+            if not media:
+                logger.warning("⚠️ Media non trovato dopo import con id: %s", media_id)
+                outcomes.append(None)
+                continue
+            if not current_languages:
+                logger.warning("⚠️ Current Languages non trovato dopo import con id: %s", media_id)
+                outcomes.append(None)
+                continue
+
+            previous_languages = previous_by_id.get(media_id, [])
+            if not previous_languages:
+                outcome = "Notifica aggiunto inviata"
+            elif "Italian" in current_languages and "Italian" not in previous_languages:
+                outcome = "Notifica italiano inviata"
+            else:
+                outcome = "Nessun cambiamento rilevante"
+            logger.info("%s: %s", outcome, title)
+            outcomes.append(outcome)
+            if outcome != "Nessun cambiamento rilevante":
+                to_notify.append(result)
+        return outcomes, to_notify
+
+    def warm_up(self):
+        """Prepara le cache all'avvio: connessione Plex, indice GUID e database delle tracce audio."""
+        self.guid_index.load()
+        self.sync_guid_index()
+        logger.info("🔥 Cache pronte: %d GUID Plex indicizzati, %d media nel database audio",
+                    len(self.guid_index.entries), self.audio_store.count())
+
+    def sync_guid_index(self):
+        """Allinea l'indice GUID a Plex (nel leader: vedi `PlexGuidIndex.delegate`)."""
+        plex = self._get_plex()
+        if plex is not None:
+            self.guid_index.sync(plex)
+
+    def plex_health(self):
+        """Stato della connessione a Plex per /readyz."""
+        if not self.plex_url or not self.plex_token:
+            return {"status": "disabled"}
+        if self._get_plex() is None:
+            return {"status": "error", "error": "Plex non raggiungibile"}
+        return {"status": "ok", "guid_index": len(self.guid_index.entries), "alerts": self.alert_listener.running}
 
-        audio_db = _load_audio_db()
-        previous_languages = audio_db.get(media_id, [])
-
-        if not previous_languages:
-            await self.send_telegram_notification(title, current_languages, media.summary, media_id, media_type)
-            save_languages_on_db(title, media, current_languages, media_id)
-            logger.info("Notifica aggiunto inviata")
-            return "Notifica aggiunto inviata"
-        elif "Italian" in current_languages and "Italian" not in previous_languages:
-            await self.send_telegram_notification(title, current_languages, media.summary, media_id, media_type)
-            save_languages_on_db(title, media, current_languages, media_id)
-            logger.info("Notifica italiano inviata")
-            return "Notifica italiano inviata"
-        else:
-            logger.info("Nessun cambiamento rilevante")
-            return "Nessun cambiamento rilevante"
+    async def telegram_health(self):
+        """Stato del bot Telegram per /readyz."""
+        if not self.telegram_bot_token or not self.telegram_chat_id:
+            return {"status": "disabled"}
+        if not self.bot:
+            return {"status": "error", "error": "Bot Telegram non inizializzato"}
+        me = await self.bot.get_me()
+        return {"status": "ok", "bot": me.username}
+
+    async def aclose(self):
+        await asyncio.to_thread(self.alert_listener.stop)
+        await self.kometa.stop()
+        await self.http.aclose()
+        self.telegram_limiter.close()
 
-    def get_tmdb_italian_movie_poster(self, tmdb_id):
-        url = f"https://api.themoviedb.org/3/movie/{tmdb_id}/images?api_key={self.tmdb_api_key}&include_image_language=it,null"
-        r = requests.get(url)
+    async def get_tmdb_image_url(self, media_id, media_type):
+        """
+        Restituisce l'URL dell'immagine TMDB del media (poster per i film, still per gli episodi).
+        Gli URL trovati restano in cache per `TMDB_CACHE_TTL` secondi.
+        """
+        cache_key = (media_type, media_id)
+        image_url = self.image_url_cache.get(cache_key)
+        if image_url is not None:
+            return image_url
+
+        try:
+            if media_type == "movie":
+                image_url = await self.get_tmdb_italian_movie_poster(media_id)
+            else:
+                image_url = await self.get_tmdb_episode_still(media_id)
+        except httpx.HTTPError as e:
+            logger.error("❌ Errore nella chiamata a TMDB per %s: %s", media_id, e)
+            return None
+
+        if image_url is not None:
+            self.image_url_cache.set(cache_key, image_url)
+        return image_url
+
+    async def download_image(self, image_url):
+        """Scarica l'immagine, servendola dalla cache su disco quando possibile."""
+        content = await asyncio.to_thread(self.image_cache.get, image_url)
+        if content is not None:
+            return content
+
+        try:
+            response = await self.http.get(image_url)
+        except httpx.HTTPError as e:
+            logger.error("❌ Errore nel download dell'immagine: %s", e)
+            return None
+        if response.status_code != 200:
+            logger.error("❌ Errore nel download dell'immagine: status %d", response.status_code)
+            return None
+
+        await asyncio.to_thread(self.image_cache.put, image_url, response.content)
+        return response.content
+
+    async def get_tmdb_italian_movie_poster(self, tmdb_id):
+        url = f"{TMDB_API_URL}/movie/{tmdb_id}/images"
+        r = await self.http.get(url, params={"api_key": self.tmdb_api_key, "include_image_language": "it,null"})
         if r.status_code != 200:
             return None
         posters = r.json().get("posters", [])
         if not posters:
             return None
         best_image = max(posters, key=lambda s: s.get("width", 0) * s.get("height", 0))
-        return f"https://image.tmdb.org/t/p/original{best_image['file_path']}"
+        return f"{TMDB_IMAGE_URL}/{self.tmdb_image_size}{best_image['file_path']}"
 
-    def get_tmdb_episode_still(self, episode_str):
+    async def get_tmdb_episode_still(self, episode_str):
         tv_id, season, episode = parse_episode_string(episode_str)
-        url = (
-            f"https://api.themoviedb.org/3/tv/{tv_id}/season/{season}/episode/{episode}/images"
-            f"?api_key={self.tmdb_api_key}&include_image_language=it,null"
-        )
-        r = requests.get(url)
+        url = f"{TMDB_API_URL}/tv/{tv_id}/season/{season}/episode/{episode}/images"
+        r = await self.http.get(url, params={"api_key": self.tmdb_api_key, "include_image_language": "it,null"})
         if r.status_code != 200:
             return None
         stills = r.json().get("stills", [])
         if not stills:
             return None
         best_image = max(stills, key=lambda s: s.get("width", 0) * s.get("height", 0))
-        return f"https://image.tmdb.org/t/p/original{best_image['file_path']}"
+        return f"{TMDB_IMAGE_URL}/{self.tmdb_image_size}{best_image['file_path']}"
+
+
+def digest_line(media, languages):
+    """Riga del riepilogo per un episodio: codice, titolo e bandiere delle lingue audio."""
+    flags = ' '.join(flag_mapping.get(lang, lang) for lang in languages)
+    return f"<b>{media.seasonEpisode.upper()}</b> {html.escape(media.title)} {flags}"
+
+
+def fit_lines(header, lines, limit):
+    """Unisce intestazione e righe restando entro `limit` caratteri, riassumendo quelle escluse."""
+    text = header
+    for index, line in enumerate(lines):
+        remaining = len(lines) - index
+        suffix = f"\n… e altri {remaining - 1} episodi" if remaining > 1 else ""
+        if len(text) + 1 + len(line) + len(suffix) > limit:
+            return f"{text}\n… e altri {remaining} episodi"
+        text += f"\n{line}"
+    return text
+
+
+def imported_files(data):
+    """
+    File importati secondo il webhook (`movieFile`, `episodeFile`, `episodeFiles`) come coppie
+    (nome del file, dimensione). Si confronta il solo nome perché il percorso può essere
+    diverso tra Sonarr/Radarr e Plex (volumi Docker).
+    """
+    files = [data.get('movieFile'), data.get('episodeFile'), *(data.get('episodeFiles') or [])]
+    result = []
+    for file in files:
+        if not isinstance(file, dict):
+            continue
+        path = file.get('path') or file.get('relativePath')
+        if path:
+            result.append((ntpath.basename(path), file.get('size')))
+    return result
+
+
+def _audio_stream_languages(media):
+    """Lingue deduplicate delle tracce audio presenti sull'oggetto, in ordine."""
+    return list(dict.fromkeys(stream.language for version in media.media for part in version.parts
+                              for stream in part.streams if stream.streamType == 2 and stream.language))
+
+
+def is_stale(media, files, updated_since=None):
+    """
+    Vero se Plex mostra ancora il media com'era prima dell'import: nessuna parte corrisponde
+    per nome (e dimensione, se nota) ai file importati, oppure l'elemento non è stato
+    aggiornato dopo `updated_since`. Senza file né `updated_since` il media non è mai stale.
+    """
+    if files:
+        for version in media.media:
+            for part in version.parts:
+                name = ntpath.basename(part.file or "")
+                for file_name, size in files:
+                    if name == file_name and (not size or not part.size or int(size) == part.size):
+                        return False
+        return True
+    if updated_since is not None:
+        return media.updatedAt is None or media.updatedAt.timestamp() < updated_since
+    return False
 
 
 def parse_episode_string(episode_str):
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TorrentCleanerScheduler:
+    """
+    Esegue la pulizia dei torrent a intervalli regolari invece che a ogni webhook.
+
+    I webhook si limitano a segnare la pulizia come necessaria (`mark_dirty`): dopo una breve
+    finestra di attesa tutte le richieste arrivate nel frattempo vengono servite da un'unica
+    passata. Un lock garantisce che giri al massimo una passata alla volta.
+    """
+
+    def __init__(self, cleaner, interval=None, debounce=None):
+        self.cleaner = cleaner
+        self.interval = interval or int(os.getenv("CLEAN_INTERVAL_SECONDS", 1800))
+        self.debounce = debounce if debounce is not None else int(os.getenv("CLEAN_DEBOUNCE_SECONDS", 30))
+        self._dirty = None
+        self._lock = None
+        self._task = None
+
+    async def start(self):
+        self._dirty = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = asyncio.create_task(self._loop())
+        logger.info("⏱️ Pulizia torrent programmata ogni %ds (attesa dopo webhook: %ds)",
+                    self.interval, self.debounce)
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def mark_dirty(self):
+        """Richiede una passata di pulizia; più richieste ravvicinate vengono unite."""
+        if self._dirty is not None:
+            self._dirty.set()
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._dirty.wait(), timeout=self.interval)
+                # Attende che il burst di webhook si esaurisca prima di partire
+                await asyncio.sleep(self.debounce)
+            except asyncio.TimeoutError:
+                pass
+            self._dirty.clear()
+            await self.run_once()
+
+    async def run_once(self):
+        """Esegue una passata di pulizia, a meno che non ce ne sia già una in corso."""
+        if self._lock.locked():
+            logger.info("⏭️ Pulizia torrent già in corso, passata saltata")
+            return None
+
+        async with self._lock:
+            started_at = time.monotonic()
+            try:
+                deleted = await asyncio.to_thread(self.cleaner.clean_torrents)
+            except Exception as e:
+                logger.exception("❌ Errore durante la pulizia dei torrent: %s", e)
+                return None
+            logger.info("🧹 Pulizia torrent completata in %.2fs: %d torrent eliminati",
+                        time.monotonic() - started_at, deleted or 0)
+            return deleted
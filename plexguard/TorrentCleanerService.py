@@ -1,13 +1,17 @@
-import datetime
 import logging
 import os
+import threading
 
 import requests
 
+from plexguard.TorrentRules import TorrentRules, format_size, report
+
 # Configura il logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+REQUEST_TIMEOUT = 30
+
 
 class TorrentCleanerService:
     def __init__(self):
@@ -15,37 +19,36 @@ class TorrentCleanerService:
         self.username = os.getenv("QBITTORRENT_USER")
         self.password = os.getenv("QBITTORRENT_PASS")
         self.days_old = int(os.getenv("DAYS_OLD", 90))
+        # Regole da TORRENT_RULES_FILE; senza file: senza commento oppure più vecchi di DAYS_OLD giorni
+        self.rules = TorrentRules.load(days_old=self.days_old)
+        self.dry_run = os.getenv("TORRENT_CLEAN_DRY_RUN", "false").lower() == "true"
         self.session = None
-
-        # Se i parametri fondamentali sono mancanti, disabilita il login
-        if not self.qbittorrent_url or not self.username or not self.password:
+        # Mirror locale dei torrent (hash → proprietà), aggiornato con i delta di /sync/maindata
+        self.torrents = {}
+        self.rid = 0
+        # Sessione e mirror sono usati dallo scheduler, dal warm-up e da /readyz in thread diversi
+        self._lock = threading.RLock()
+
+        # Il login avviene alla prima richiesta, così l'avvio non dipende da qBittorrent
+        if not self.configured:
             logger.warning("⚠️ Parametri mancanti: il servizio partirà senza connessione a qBittorrent.")
-        else:
-            self.login()
 
-    def is_session_active(self):
-        """Verifica se la sessione è ancora attiva effettuando una richiesta di test."""
-        if not self.session:
-            return False
-        try:
-            # Facciamo una richiesta semplice per controllare la validità della sessione
-            response = self.session.get(f"{self.qbittorrent_url}/api/v2/app/version", timeout=5)
-            return response.status_code == 200
-        except requests.RequestException:
-            return False
+    @property
+    def configured(self):
+        return bool(self.qbittorrent_url and self.username and self.password)
 
     def login(self):
         """ Effettua il login a qBittorrent e memorizza la sessione """
-        if self.is_session_active():
-            return True
-
         self.session = requests.Session()
         login_data = {"username": self.username, "password": self.password}
 
         try:
-            response = self.session.post(f"{self.qbittorrent_url}/api/v2/auth/login", data=login_data)
+            response = self.session.post(f"{self.qbittorrent_url}/api/v2/auth/login", data=login_data,
+                                         timeout=REQUEST_TIMEOUT)
             if response.status_code == 200 and response.text == "Ok.":
                 logger.info("✅ Login a qBittorrent riuscito!")
+                # Lo stato di sync/maindata è legato alla sessione: si riparte da un aggiornamento completo
+                self.rid = 0
                 return True
             else:
                 logger.error("❌ Errore di login su qBittorrent: %s", response.text)
@@ -55,57 +58,94 @@ class TorrentCleanerService:
         self.session = None
         return False
 
-    def delete_torrent(self, torrent_hash, delete_files=True):
-        """ Elimina un torrent per hash """
-        if not self.login():
-            return
+    def _request(self, method, path, **kwargs):
+        """ Chiama l'API di qBittorrent, rifacendo il login solo se la sessione è scaduta (403) """
+        if not self.configured:
+            return None
+        if not self.session and not self.login():
+            return None
 
+        url = f"{self.qbittorrent_url}{path}"
         try:
-            response = self.session.post(
-                f"{self.qbittorrent_url}/api/v2/torrents/delete",
-                data={"hashes": torrent_hash, "deleteFiles": str(delete_files).lower()}
-            )
-            if response.status_code == 200:
-                logger.info("🗑️ Torrent eliminato con successo: %s", torrent_hash)
-                return True
-            logger.warning("⚠️ Impossibile eliminare il torrent %s - Status Code: %d", torrent_hash,
-                           response.status_code)
+            response = self.session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+            if response.status_code == 403:
+                logger.info("🔑 Sessione qBittorrent scaduta, nuovo login")
+                if not self.login():
+                    return None
+                response = self.session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+            return response
         except requests.RequestException as e:
-            logger.error("❌ Errore durante l'eliminazione del torrent %s: %s", torrent_hash, e)
-
-        return False
+            logger.error("⚠️ Errore di connessione a qBittorrent (%s): %s", path, e)
+            return None
+
+    def sync(self):
+        """ Aggiorna il mirror locale dei torrent scaricando solo i delta da /sync/maindata """
+        with self._lock:
+            response = self._request("GET", "/api/v2/sync/maindata", params={"rid": self.rid})
+            if response is None or response.status_code != 200:
+                logger.error("Errore nel recupero dei torrent")
+                return False
+
+            data = response.json()
+            if data.get("full_update"):
+                self.torrents = {}
+            for torrent_hash, changes in data.get("torrents", {}).items():
+                self.torrents.setdefault(torrent_hash, {"hash": torrent_hash}).update(changes)
+            for torrent_hash in data.get("torrents_removed", []):
+                self.torrents.pop(torrent_hash, None)
+            self.rid = data.get("rid", self.rid)
+            return True
 
-    def clean_torrents(self):
-        """ Controlla i torrent e applica le regole di eliminazione """
-        if not self.login():
-            return
-
-        response = self.session.get(f"{self.qbittorrent_url}/api/v2/torrents/info")
-        if response.status_code != 200:
-            logger.error("Errore nel recupero dei torrent")
-            return
-
-        torrents = response.json()
-        deleted_count = 0
-        now = datetime.datetime.now()
-
-        for torrent in torrents:
-            torrent_hash = torrent["hash"]
-            added_on = datetime.datetime.fromtimestamp(torrent["added_on"])
-            days_old = (now - added_on).days
-            comment = torrent.get("comment", "").strip()
-
-            # Controlla se il torrent è completo
-            if torrent["progress"] < 1.0:
-                continue
-
-            # Criterio di eliminazione: Senza commento o troppo vecchio
-            if not comment or comment == "dynamic metainfo from client":
-                logger.info(f"🚮 Eliminando torrent senza commento: {torrent['name']}")
-                if self.delete_torrent(torrent_hash):
-                    deleted_count += 1
-            elif days_old > self.days_old:
-                logger.info(
-                    f"📅 Eliminando torrent '{torrent['name']}' con commento (aggiunto {days_old} giorni fa)")
-                if self.delete_torrent(torrent_hash):
-                    deleted_count += 1
+    def health(self):
+        """Stato della connessione a qBittorrent per /readyz (aggiorna anche il mirror dei torrent)."""
+        if not self.configured:
+            return {"status": "disabled"}
+        if not self.sync():
+            return {"status": "error", "error": "qBittorrent non raggiungibile"}
+        return {"status": "ok", "torrents": len(self.torrents)}
+
+    def delete_torrents(self, torrent_hashes, delete_files=True):
+        """ Elimina più torrent con un'unica richiesta; restituisce quanti ne sono stati eliminati """
+        if not torrent_hashes:
+            return 0
+
+        with self._lock:
+            response = self._request(
+                "POST", "/api/v2/torrents/delete",
+                data={"hashes": "|".join(torrent_hashes), "deleteFiles": str(delete_files).lower()}
+            )
+            if response is None:
+                return 0
+            if response.status_code != 200:
+                logger.warning("⚠️ Impossibile eliminare %d torrent - Status Code: %d", len(torrent_hashes),
+                               response.status_code)
+                return 0
+
+            for torrent_hash in torrent_hashes:
+                self.torrents.pop(torrent_hash, None)
+        logger.info("🗑️ Eliminati con successo %d torrent", len(torrent_hashes))
+        return len(torrent_hashes)
+
+    def clean_torrents(self, dry_run=None):
+        """
+        Applica le regole di eliminazione in una sola passata sul mirror dei torrent e
+        restituisce il numero di eliminati. In dry-run riporta solo cosa verrebbe eliminato
+        e lo spazio che si libererebbe, senza chiamare /torrents/delete. Il mirror resta
+        bloccato per tutta la passata, così un sync concorrente (es. da /readyz) non lo modifica.
+        """
+        with self._lock:
+            if not self.sync():
+                return 0
+
+            dry_run = self.dry_run if dry_run is None else dry_run
+            selected = self.rules.select(self.torrents.values())
+            for torrent, rule in selected:
+                logger.info("🚮 %s torrent '%s' (regola: %s)", "Da eliminare" if dry_run else "Eliminando",
+                            torrent.get("name"), rule)
+
+            if dry_run:
+                summary = report(selected)
+                logger.info("🧪 Dry-run: %d di %d torrent verrebbero eliminati, %s liberati",
+                            summary["torrents"], len(self.torrents), format_size(summary["bytes"]))
+                return 0
+            return self.delete_torrents([torrent["hash"] for torrent, rule in selected])
@@ -0,0 +1,245 @@
+"""
+Regole di eliminazione dei torrent, dichiarate in JSON e compilate una sola volta.
+
+Esempio di file (TORRENT_RULES_FILE):
+    {"rules": [
+        {"name": "tracker privato", "action": "keep", "tracker": ["privatehd"]},
+        {"name": "senza commento", "completed": true, "comment": ["", "dynamic metainfo from client"]},
+        {"name": "serie viste", "completed": true, "category": "tv-sonarr", "min_ratio": 1.0,
+         "min_seeding_days": 14},
+        {"name": "vecchi", "completed": true, "older_than_days": 90}
+    ]}
+
+Le regole vengono valutate in ordine e decide la prima che corrisponde: "delete" (default)
+elimina il torrent, "keep" lo protegge dalle regole successive. Tutte le condizioni di una
+regola devono essere vere. Una regola "delete" deve avere almeno una condizione e, se non
+indica `completed`, vale solo per i torrent completati. Per un report senza eliminare nulla:
+    python -m plexguard.TorrentRules
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+DELETE = "delete"
+KEEP = "keep"
+
+DAY = 86400
+GB = 1024 ** 3
+
+# Commenti che qBittorrent imposta quando il .torrent non ne ha uno
+EMPTY_COMMENTS = ["", "dynamic metainfo from client"]
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _tags(torrent):
+    return {tag.strip() for tag in torrent.get("tags", "").split(",") if tag.strip()}
+
+
+def _completed(value):
+    return lambda torrent, now: (torrent.get("progress", 0) >= 1.0) == bool(value)
+
+
+def _category(value):
+    categories = frozenset(_as_list(value))
+    return lambda torrent, now: torrent.get("category", "") in categories
+
+
+def _tag(value):
+    tags = frozenset(_as_list(value))
+    return lambda torrent, now: not tags.isdisjoint(_tags(torrent))
+
+
+def _tracker(value):
+    fragments = tuple(fragment.lower() for fragment in _as_list(value))
+    return lambda torrent, now: any(fragment in torrent.get("tracker", "").lower() for fragment in fragments)
+
+
+def _comment(value):
+    comments = frozenset(comment.strip() for comment in _as_list(value))
+    return lambda torrent, now: torrent.get("comment", "").strip() in comments
+
+
+def _comment_contains(value):
+    fragments = tuple(fragment.lower() for fragment in _as_list(value))
+    return lambda torrent, now: any(fragment in torrent.get("comment", "").lower() for fragment in fragments)
+
+
+def _min_ratio(value):
+    return lambda torrent, now: torrent.get("ratio", 0) >= value
+
+
+def _max_ratio(value):
+    return lambda torrent, now: torrent.get("ratio", 0) < value
+
+
+def _min_seeding_days(value):
+    seconds = value * DAY
+    return lambda torrent, now: torrent.get("seeding_time", 0) >= seconds
+
+
+def _min_size_gb(value):
+    size = value * GB
+    return lambda torrent, now: torrent.get("size", 0) >= size
+
+
+def _max_size_gb(value):
+    size = value * GB
+    return lambda torrent, now: torrent.get("size", 0) < size
+
+
+def _older_than_days(value):
+    # Come il vecchio controllo `(now - added_on).days > DAYS_OLD`: più di `value` giorni interi
+    seconds = (int(value) + 1) * DAY
+    return lambda torrent, now: now - torrent.get("added_on", 0) >= seconds
+
+
+CONDITIONS = {
+    "completed": _completed,
+    "category": _category,
+    "tag": _tag,
+    "tracker": _tracker,
+    "comment": _comment,
+    "comment_contains": _comment_contains,
+    "min_ratio": _min_ratio,
+    "max_ratio": _max_ratio,
+    "min_seeding_days": _min_seeding_days,
+    "min_size_gb": _min_size_gb,
+    "max_size_gb": _max_size_gb,
+    "older_than_days": _older_than_days,
+}
+
+
+def default_rules(days_old):
+    """La politica storica: torrent completi senza commento oppure più vecchi di `days_old` giorni."""
+    return [
+        {"name": "senza commento", "completed": True, "comment": EMPTY_COMMENTS},
+        {"name": f"più vecchio di {days_old} giorni", "completed": True, "older_than_days": days_old},
+    ]
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class TorrentRules:
+    """Insieme ordinato di regole compilate, valutato in una sola passata sulla lista dei torrent."""
+
+    def __init__(self, rules):
+        self.rules = [self._compile(index, rule) for index, rule in enumerate(rules)]
+
+    @staticmethod
+    def _compile(index, rule):
+        name = rule.get("name", f"regola {index + 1}")
+        action = rule.get("action", DELETE)
+        if action not in (DELETE, KEEP):
+            raise ValueError(f"Regola '{name}': azione sconosciuta '{action}'")
+        conditions = {key: value for key, value in rule.items() if key not in ("name", "action")}
+        for key in conditions:
+            if key not in CONDITIONS:
+                raise ValueError(f"Regola '{name}': condizione sconosciuta '{key}'")
+        if action == DELETE:
+            if not conditions:
+                raise ValueError(f"Regola '{name}': una regola di eliminazione deve avere almeno una condizione")
+            # Come la vecchia pulizia: i torrent incompleti si eliminano solo chiedendolo esplicitamente
+            conditions = {"completed": True, **conditions}
+        return name, action, tuple(CONDITIONS[key](value) for key, value in conditions.items())
+
+    @classmethod
+    def load(cls, path=None, days_old=90):
+        """
+        Carica le regole da `path` (o TORRENT_RULES_FILE); senza file usa la politica storica.
+        Un file non valido non elimina nulla, per non applicare regole diverse da quelle volute.
+        """
+        path = path or os.getenv("TORRENT_RULES_FILE")
+        if not path:
+            return cls(default_rules(days_old))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                content = json.load(f)
+            rules = cls(content["rules"] if isinstance(content, dict) else content)
+        except Exception as e:
+            logger.error("❌ Regole torrent non valide in %s, nessun torrent verrà eliminato: %s", path, e)
+            return cls([])
+        logger.info("📜 Caricate %d regole di pulizia torrent da %s", len(rules.rules), path)
+        return rules
+
+    def select(self, torrents, now=None):
+        """Restituisce [(torrent, nome regola)] dei torrent da eliminare."""
+        now = now if now is not None else time.time()
+        rules = self.rules
+        selected = []
+        for torrent in torrents:
+            for name, action, predicates in rules:
+                for predicate in predicates:
+                    if not predicate(torrent, now):
+                        break
+                else:
+                    if action == DELETE:
+                        selected.append((torrent, name))
+                    break
+        return selected
+
+
+def report(selected):
+    """Riepilogo per regola di quanti torrent verrebbero eliminati e dello spazio liberato."""
+    by_rule = {}
+    for torrent, rule in selected:
+        count, size = by_rule.get(rule, (0, 0))
+        by_rule[rule] = (count + 1, size + torrent.get("size", 0))
+    return {
+        "torrents": len(selected),
+        "bytes": sum(size for count, size in by_rule.values()),
+        "rules": {rule: {"torrents": count, "bytes": size} for rule, (count, size) in by_rule.items()},
+    }
+
+
+def main(argv=None):
+    from plexguard.TorrentCleanerService import TorrentCleanerService
+
+    parser = argparse.ArgumentParser(description="Mostra quali torrent eliminerebbero le regole, senza eliminarli")
+    parser.add_argument("--rules", help="File JSON delle regole (default: TORRENT_RULES_FILE o politica storica)")
+    parser.add_argument("--list", action="store_true", help="Elenca anche i singoli torrent")
+    parser.add_argument("--json", action="store_true", help="Stampa il report in JSON")
+    args = parser.parse_args(argv)
+
+    cleaner = TorrentCleanerService()
+    if args.rules:
+        cleaner.rules = TorrentRules.load(args.rules, cleaner.days_old)
+    if not cleaner.sync():
+        return 1
+
+    started_at = time.perf_counter()
+    selected = cleaner.rules.select(cleaner.torrents.values())
+    elapsed = time.perf_counter() - started_at
+    summary = report(selected)
+    if args.json:
+        if args.list:
+            summary["list"] = [{"hash": torrent["hash"], "name": torrent.get("name"), "rule": rule,
+                                "bytes": torrent.get("size", 0)} for torrent, rule in selected]
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+        return 0
+
+    if args.list:
+        for torrent, rule in selected:
+            print(f"{format_size(torrent.get('size', 0)):>10}  [{rule}]  {torrent.get('name')}")
+    for rule, stats in summary["rules"].items():
+        print(f"{rule}: {stats['torrents']} torrent, {format_size(stats['bytes'])}")
+    print(f"Totale: {summary['torrents']} di {len(cleaner.torrents)} torrent da eliminare, "
+          f"{format_size(summary['bytes'])} liberati (valutazione in {elapsed * 1000:.1f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
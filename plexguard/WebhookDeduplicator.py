@@ -0,0 +1,149 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from plexguard.TTLCache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Gli eventi sono salvati nello stesso database SQLite delle tracce audio
+WEBHOOK_EVENTS_DB = Path(os.getenv("WEBHOOK_EVENTS_DB", os.getenv("AUDIO_TRACKS_DB", "audio_tracks.db")))
+
+PENDING = "pending"
+DONE = "done"
+
+
+def webhook_fingerprint(name, data):
+    """
+    Impronta di un webhook Sonarr/Radarr: endpoint, tipo di evento, id di serie/film,
+    elenco degli episodi, file importati e downloadId. Campi variabili come le date non
+    contano, quindi i reinvii dello stesso evento producono la stessa impronta.
+    """
+    series = data.get("series") or {}
+    movie = data.get("movie") or {}
+    episodes = {(str(episode.get("seasonNumber")), str(episode.get("episodeNumber")))
+                for episode in data.get("episodes") or [] if isinstance(episode, dict)}
+    # Payload con `type` "season"/"episode": stagione ed episodi ("1-2-3") nella serie, come in normalize_data
+    if data.get("type") in ("season", "episode"):
+        episodes.update((str(series.get("seasonNumber")), number.strip())
+                        for number in str(series.get("episodeNumber") or "").split("-") if number.strip())
+    files = [data.get("movieFile"), data.get("episodeFile"), *(data.get("episodeFiles") or [])]
+    key = {
+        "endpoint": name,
+        "eventType": data.get("eventType"),
+        "type": data.get("type"),
+        "series": [series.get("id"), series.get("tvdbId"), series.get("tmdbId"), series.get("imdbId")],
+        "movie": [movie.get("id"), movie.get("tmdbId"), movie.get("imdbId")],
+        "episodes": sorted(episodes),
+        "files": sorted(str(file.get("path") or file.get("relativePath")) for file in files if isinstance(file, dict)),
+        "downloadId": data.get("downloadId"),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class WebhookDeduplicator:
+    """
+    Riconosce i webhook ripetuti (Sonarr e Radarr reinviano quelli andati in timeout).
+
+    Ogni evento accettato viene registrato con la sua impronta; entro `window` secondi un
+    evento con la stessa impronta non viene rielaborato e riceve l'esito già salvato.
+    Gli esiti recenti sono tenuti in una LRU in memoria, con SQLite come archivio
+    persistente condiviso, così la deduplica sopravvive ai riavvii e vale tra più worker:
+    la registrazione avviene in una transazione esclusiva, quindi lo stesso evento ricevuto
+    da due processi insieme viene accettato una volta sola.
+    """
+
+    def __init__(self, path=WEBHOOK_EVENTS_DB, window=None, cache_size=None):
+        self.window = window if window is not None else float(os.getenv("WEBHOOK_DEDUP_WINDOW", 3600))
+        self.cache = TTLCache(maxsize=cache_size or int(os.getenv("WEBHOOK_DEDUP_CACHE_SIZE", 1024)),
+                              ttl=self.window)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(Path(path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS webhook_events ("
+                " fingerprint TEXT PRIMARY KEY,"
+                " endpoint TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " result TEXT,"
+                " received_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS webhook_events_received_at"
+                               " ON webhook_events (received_at)")
+        self.purge()
+
+    def claim(self, name, data):
+        """
+        Registra l'evento se non è già stato visto nella finestra.
+        Restituisce (impronta, None) per un evento nuovo, (impronta, evento) per un duplicato,
+        dove evento è un dizionario con `status` ("pending" o "done") e `result`.
+        """
+        fingerprint = webhook_fingerprint(name, data)
+        if self.window <= 0:
+            return fingerprint, None
+
+        # In memoria solo gli esiti definitivi: un evento "pending" può essere concluso da un altro worker
+        with self._lock:
+            event = self.cache.get(fingerprint)
+        if event is not None:
+            return fingerprint, event
+
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT status, result FROM webhook_events WHERE fingerprint = ? AND received_at >= ?",
+                (fingerprint, now - self.window)).fetchone()
+            if row is None:
+                self._conn.execute("DELETE FROM webhook_events WHERE received_at < ?", (now - self.window,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO webhook_events (fingerprint, endpoint, status, result, received_at)"
+                    " VALUES (?, ?, ?, NULL, ?)",
+                    (fingerprint, name, PENDING, now))
+                return fingerprint, None
+
+        event = {"status": row[0], "result": json.loads(row[1]) if row[1] else None}
+        if event["status"] == DONE:
+            with self._lock:
+                self.cache.set(fingerprint, event)
+        return fingerprint, event
+
+    def complete(self, fingerprint, result):
+        """Salva l'esito dell'elaborazione, restituito ai duplicati successivi."""
+        if self.window <= 0:
+            return
+        try:
+            encoded = json.dumps(result, default=str)
+        except (TypeError, ValueError):
+            encoded = json.dumps(str(result))
+        with self._lock:
+            with self._conn:
+                self._conn.execute("UPDATE webhook_events SET status = ?, result = ? WHERE fingerprint = ?",
+                                   (DONE, encoded, fingerprint))
+            self.cache.set(fingerprint, {"status": DONE, "result": json.loads(encoded)})
+
+    def forget(self, fingerprint):
+        """Dimentica l'evento (job rifiutato o fallito), così un reinvio verrà elaborato."""
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM webhook_events WHERE fingerprint = ?", (fingerprint,))
+            self.cache.pop(fingerprint)
+
+    def purge(self):
+        """Elimina gli eventi più vecchi della finestra di deduplica."""
+        with self._lock, self._conn:
+            deleted = self._conn.execute("DELETE FROM webhook_events WHERE received_at < ?",
+                                         (time.time() - self.window,)).rowcount
+        if deleted:
+            logger.info("🧹 Eliminati %d eventi webhook scaduti", deleted)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# I job sono salvati nello stesso database SQLite delle tracce audio
+WEBHOOK_JOBS_DB = Path(os.getenv("WEBHOOK_JOBS_DB", os.getenv("AUDIO_TRACKS_DB", "audio_tracks.db")))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class WebhookJobStore:
+    """
+    Coda persistente dei job webhook su SQLite.
+
+    Ogni job ha uno stato (queued → running → done/failed), il numero di tentativi,
+    l'istante del prossimo tentativo (`next_run_at`) e l'ultimo errore. La coda può essere
+    condivisa da più processi: un job viene preso in una transazione esclusiva e, finché è
+    "running", `next_run_at` fa da lease rinnovato dal worker (`renew`). Se il processo muore
+    il lease scade e il job viene ripreso da un altro worker; i job di un processo precedente
+    sullo stesso host tornano subito in coda all'apertura del database. Un job rimandato
+    (`defer`) torna in coda senza consumare un tentativo e può essere anticipato con
+    `wake_deferred`.
+    """
+
+    def __init__(self, path=WEBHOOK_JOBS_DB, retention=None, lease=None):
+        self.path = Path(path)
+        # Per quanto tempo restano i job conclusi (done/failed), per ispezione
+        self.retention = retention if retention is not None else float(os.getenv("WEBHOOK_JOB_RETENTION", 604800))
+        self.lease = lease or float(os.getenv("WEBHOOK_JOB_LEASE", 60))
+        self.hostname = socket.gethostname()
+        self.owner = f"{self.hostname}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS webhook_jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " name TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " fingerprint TEXT,"
+                " status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_run_at REAL NOT NULL,"
+                " last_error TEXT,"
+                " result TEXT,"
+                " owner TEXT,"
+                " deferred INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(webhook_jobs)")}
+            if "owner" not in columns:
+                self._conn.execute("ALTER TABLE webhook_jobs ADD COLUMN owner TEXT")
+            if "deferred" not in columns:
+                self._conn.execute("ALTER TABLE webhook_jobs ADD COLUMN deferred INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS webhook_jobs_status_next_run"
+                               " ON webhook_jobs (status, next_run_at)")
+        self._resume_orphans()
+        self.purge()
+
+    def _is_orphan(self, owner):
+        """Vero se `owner` è un processo terminato di questo host (o questo stesso pid, appena avviato)."""
+        hostname, _, pid = (owner or "").rpartition(":")
+        if hostname != self.hostname or not pid.isdigit():
+            return False
+        if int(pid) == os.getpid():
+            return True
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False
+        return False
+
+    def _resume_orphans(self):
+        """Rimette subito in coda i job interrotti da un arresto di un processo di questo host."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            rows = self._conn.execute("SELECT id, owner FROM webhook_jobs WHERE status = ?", (RUNNING,)).fetchall()
+            orphans = [(job_id,) for job_id, owner in rows if self._is_orphan(owner)]
+            self._conn.executemany("UPDATE webhook_jobs SET status = ?, next_run_at = ?, owner = NULL WHERE id = ?",
+                                   [(QUEUED, time.time(), job_id) for job_id, in orphans])
+        if orphans:
+            logger.info("♻️ Ripresi %d job webhook interrotti", len(orphans))
+
+    def add(self, name, data, fingerprint=None):
+        """Accoda un job e ne restituisce l'id."""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO webhook_jobs (name, payload, fingerprint, status, next_run_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, json.dumps(data), fingerprint, QUEUED, now, now, now))
+        return cursor.lastrowid
+
+    def claim(self):
+        """
+        Prende il prossimo job pronto (o "running" con lease scaduto), lo segna "running" a nome
+        di questo processo e incrementa i tentativi. La transazione esclusiva impedisce a due
+        worker di prendere lo stesso job. Restituisce (id, name, data, fingerprint, attempts) o None.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT id, name, payload, fingerprint, attempts, status FROM webhook_jobs"
+                " WHERE status IN (?, ?) AND next_run_at <= ? ORDER BY next_run_at, id LIMIT 1",
+                (QUEUED, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE webhook_jobs SET status = ?, attempts = attempts + 1, next_run_at = ?, owner = ?,"
+                " deferred = 0, updated_at = ? WHERE id = ?",
+                (RUNNING, now + self.lease, self.owner, now, row[0]))
+        job_id, name, payload, fingerprint, attempts, status = row
+        if status == RUNNING:
+            logger.info("♻️ Job webhook %d ripreso: lease del worker precedente scaduto", job_id)
+        return {"id": job_id, "name": name, "data": json.loads(payload), "fingerprint": fingerprint,
+                "attempts": attempts + 1}
+
+    def renew(self, job_id):
+        """Rinnova il lease di un job in elaborazione; False se il job non è più di questo processo."""
+        now = time.time()
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE webhook_jobs SET next_run_at = ?, updated_at = ? WHERE id = ? AND status = ? AND owner = ?",
+                (now + self.lease, now, job_id, RUNNING, self.owner)).rowcount == 1
+
+    def complete(self, job_id, result):
+        try:
+            encoded = json.dumps(result, default=str)
+        except (TypeError, ValueError):
+            encoded = json.dumps(str(result))
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE webhook_jobs SET status = ?, result = ?, last_error = NULL, updated_at = ?"
+                " WHERE id = ? AND owner = ?",
+                (DONE, encoded, time.time(), job_id, self.owner))
+
+    def retry(self, job_id, error, delay):
+        """Rimette in coda il job dopo `delay` secondi, registrando l'errore."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE webhook_jobs SET status = ?, next_run_at = ?, last_error = ?, owner = NULL, updated_at = ?"
+                " WHERE id = ? AND owner = ?",
+                (QUEUED, now + delay, error, now, job_id, self.owner))
+
+    def defer(self, job_id, data, delay):
+        """
+        Rimette in coda il job dopo `delay` secondi senza contare il tentativo, salvando il
+        payload aggiornato dal job (es. lo stato dell'attesa) per la ripresa.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE webhook_jobs SET status = ?, payload = ?, attempts = attempts - 1, next_run_at = ?,"
+                " deferred = 1, owner = NULL, updated_at = ? WHERE id = ? AND owner = ?",
+                (QUEUED, json.dumps(data), now + delay, now, job_id, self.owner))
+
+    def wake_deferred(self):
+        """Rende subito pronti i job rimandati con `defer`; restituisce quanti sono."""
+        now = time.time()
+        with self._lock, self._conn:
+            return self._conn.execute(
+                "UPDATE webhook_jobs SET next_run_at = ? WHERE status = ? AND deferred = 1 AND next_run_at > ?",
+                (now, QUEUED, now)).rowcount
+
+    def fail(self, job_id, error):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE webhook_jobs SET status = ?, last_error = ?, updated_at = ? WHERE id = ? AND owner = ?",
+                (FAILED, error, time.time(), job_id, self.owner))
+
+    def pending(self):
+        """Numero di job in coda o in elaborazione."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM webhook_jobs WHERE status IN (?, ?)",
+                                      (QUEUED, RUNNING)).fetchone()[0]
+
+    def next_run_in(self):
+        """Secondi al prossimo job in coda o lease in scadenza (0 se già pronto), None se non ce ne sono."""
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(next_run_at) FROM webhook_jobs WHERE status IN (?, ?)",
+                                     (QUEUED, RUNNING)).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def purge(self):
+        """Elimina i job conclusi più vecchi di `retention` secondi."""
+        with self._lock, self._conn:
+            deleted = self._conn.execute(
+                "DELETE FROM webhook_jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, FAILED, time.time() - self.retention)).rowcount
+        if deleted:
+            logger.info("🧹 Eliminati %d job webhook conclusi", deleted)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
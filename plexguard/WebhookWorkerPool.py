@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import os
+import time
+
+from plexguard.RetryLater import RetryLater
+from plexguard.WebhookJobStore import WebhookJobStore
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookWorkerPool:
+    """
+    Pool limitato di worker asincroni che elaborano i webhook in background.
+
+    Gli endpoint salvano il job nella coda persistente (`WebhookJobStore`) e rispondono
+    subito; i worker la consumano con al massimo `concurrency` job in parallelo, quindi i
+    job in sospeso sopravvivono a un riavvio e più processi possono condividere la stessa
+    coda (i job accodati da altri processi vengono visti entro `POLL_INTERVAL`). Un job
+    fallito viene ritentato con backoff esponenziale fino a `max_attempts` tentativi; un job
+    che solleva `RetryLater` libera il worker e torna in coda per il tempo richiesto.
+    Oltre `queue_size` job in sospeso i nuovi job vengono rifiutati.
+    """
+
+    # Attesa massima tra due controlli della coda quando non arrivano nuovi job
+    POLL_INTERVAL = 5
+
+    def __init__(self, handler, store=None, concurrency=None, queue_size=None):
+        self.handler = handler
+        self.store = store or WebhookJobStore()
+        self.concurrency = concurrency or int(os.getenv("WEBHOOK_WORKERS", 2))
+        self.queue_size = queue_size or int(os.getenv("WEBHOOK_QUEUE_SIZE", 100))
+        self.max_attempts = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", 5))
+        self.retry_backoff = float(os.getenv("WEBHOOK_RETRY_BACKOFF", 30))
+        self.retry_max_delay = float(os.getenv("WEBHOOK_RETRY_MAX_DELAY", 1800))
+        self._wakeup = None
+        self._woken_at = 0.0
+        self.workers = []
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self.workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        logger.info("👷 Avviati %d worker webhook (coda max %d, job in sospeso: %d)",
+                    self.concurrency, self.queue_size, await asyncio.to_thread(self.store.pending))
+
+    async def stop(self):
+        # I job interrotti restano "running" e verranno ripresi al prossimo avvio
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def submit(self, name, data, fingerprint=None):
+        """Accoda un job; restituisce False se la coda è piena o il pool non è avviato."""
+        if self._wakeup is None:
+            return False
+        if await asyncio.to_thread(self.store.pending) >= self.queue_size:
+            logger.warning("⚠️ Coda webhook piena (%d): job '%s' rifiutato", self.queue_size, name)
+            return False
+        await asyncio.to_thread(self.store.add, name, data, fingerprint)
+        self._wakeup.set()
+        return True
+
+    @property
+    def depth(self):
+        """Job in sospeso nella coda condivisa (query SQLite: dall'event loop usare `asyncio.to_thread`)."""
+        return self.store.pending()
+
+    async def wake_deferred(self):
+        """Riprende subito i job rimandati (es. quando Plex segnala la fine di una scansione)."""
+        self._woken_at = time.monotonic()
+        if await asyncio.to_thread(self.store.wake_deferred) and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _next_job(self):
+        """Attende il prossimo job pronto: un nuovo job o la scadenza di un backoff."""
+        while True:
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self.store.claim)
+            if job is not None:
+                return job
+            next_run_in = await asyncio.to_thread(self.store.next_run_in)
+            timeout = self.POLL_INTERVAL if next_run_in is None else min(next_run_in, self.POLL_INTERVAL)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self, job_id):
+        """Rinnova il lease del job finché è in elaborazione, così gli altri worker non lo riprendono."""
+        while True:
+            await asyncio.sleep(self.store.lease / 3)
+            if not await asyncio.to_thread(self.store.renew, job_id):
+                logger.warning("⚠️ Lease del job webhook %d perso", job_id)
+                return
+
+    async def _worker(self, index):
+        while True:
+            job = await self._next_job()
+            name = job["name"]
+            heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+            started_at = time.monotonic()
+            try:
+                result = await self.handler(job)
+            except RetryLater as e:
+                # Un risveglio arrivato mentre il job era in corso non va perso: si riprova subito
+                delay = 0 if self._woken_at >= started_at else e.delay
+                logger.info("⏳ Job '%s' rimandato di %.0fs (worker %d)", name, delay, index)
+                await asyncio.to_thread(self.store.defer, job["id"], job["data"], delay)
+                continue
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if job["attempts"] >= self.max_attempts:
+                    logger.exception("❌ Job '%s' fallito dopo %d tentativi (worker %d): %s",
+                                     name, job["attempts"], index, e)
+                    await asyncio.to_thread(self.store.fail, job["id"], error)
+                else:
+                    delay = min(self.retry_backoff * 2 ** (job["attempts"] - 1), self.retry_max_delay)
+                    logger.warning("⚠️ Errore nel job '%s' (tentativo %d, worker %d), "
+                                   "nuovo tentativo tra %.0fs: %s", name, job["attempts"], index, delay, e)
+                    await asyncio.to_thread(self.store.retry, job["id"], error, delay)
+                continue
+            finally:
+                heartbeat.cancel()
+            logger.info("✅ Job '%s' completato dal worker %d: %s", name, index, result)
+            await asyncio.to_thread(self.store.complete, job["id"], result)
@@ -0,0 +1,26 @@
+"""
+Avvio del server: `python -m plexguard`.
+
+Questo modulo non importa `plexguard.Controller`: i servizi vengono creati solo da uvicorn,
+una volta per ogni worker, e non anche nel processo principale o nel modulo `__mp_main__`
+che multiprocessing reimporta in ogni worker.
+"""
+import os
+import sys
+
+import uvicorn
+
+from plexguard import Metrics
+
+
+def main():
+    workers = int(os.getenv("PLEXGUARD_WORKERS", 1))
+    if workers > 1:
+        # Ogni worker importa l'app per conto suo: stato condiviso solo tramite SQLite e lock su file
+        Metrics.setup_multiprocess()
+    uvicorn.run("plexguard.Controller:app", host="0.0.0.0", port=5001, workers=workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())